@@ -1,43 +1,65 @@
-from typing import List, Optional
+from typing import List, Literal, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import (
+    APIRouter, Depends, Header, HTTPException, Query, Request, Response)
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from starlette.responses import StreamingResponse
 
+from app.core.normalization import identity_keys
+from app.core.pagination import get_cursor, set_next_cursor
 from app.crud.contact import contact as contact_crud
 from app.crud.lead import lead as lead_crud
+from app.crud.operator import async_operator as async_operator_crud
 from app.crud.operator import operator as operator_crud
-from app.crud.source import source as source_crud
-from app.database.session import get_db
+from app.crud.source import async_source as async_source_crud
+from app.database.session import get_async_db, get_db
 from app.models.contact import Contact as ContactModel
-from app.models.source import Source as SourceModel
-from app.schemas.contact import ContactCreate, ContactStatusUpdate
+from app.schemas.contact import (
+    ContactBatchResult, ContactCreate, ContactStatusUpdate)
 from app.schemas.response import ContactWithDetails
-from app.services.distribution import DistributionService
+from app.services.distribution import async_distribution_service
+from app.services.export import EXPORT_MEDIA_TYPES, export_contacts
+from app.services.idempotency import idempotency_store
+from app.services.ingest import NDJSONStreamingResponse, ingest_ndjson
+from app.services.intake import bulk_create_contacts, get_existing_source_ids
+from app.services.load_registry import load_registry
+from app.services.redistribution import redistribution_worker
 
 
 router = APIRouter()
-distribution_service = DistributionService()
 
 
 @router.post('/', response_model=ContactWithDetails, status_code=201)
-def create_contact(
+async def create_contact(
     contact_in: ContactCreate,
-    db: Session = Depends(get_db)
+    idempotency_key: Optional[str] = Header(
+        None, max_length=255,
+        description='Повтор запроса с тем же ключом вернет сохраненный '
+                    'ответ без создания обращения'),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    lead = lead_crud.get_or_create(
-        db,
+    request_hash = None
+    if idempotency_key:
+        request_hash = idempotency_store.fingerprint(contact_in)
+        stored = await db.run_sync(idempotency_store.get, idempotency_key)
+        if stored:
+            return idempotency_store.replay(stored, request_hash)
+
+    lead = await db.run_sync(
+        lead_crud.get_or_create_for_contact,
         external_id=contact_in.lead_external_id,
         email=contact_in.lead_email,
         phone=contact_in.lead_phone
     )
 
-    source = db.query(SourceModel).filter(
-        SourceModel.id == contact_in.source_id).first()
+    source = await async_source_crud.get(db, id=contact_in.source_id)
     if not source:
         raise HTTPException(status_code=404, detail='Source not found')
 
-    distribution_result = distribution_service.distribute(
-        db, source_id=contact_in.source_id)
+    distribution_result = await async_distribution_service.distribute(
+        db, source_id=contact_in.source_id, reserve=True, lead_id=lead.id)
 
     operator_id = None
     # ФИКС: проверяем, что distribution_result не равен None
@@ -53,77 +75,150 @@ def create_contact(
     )
 
     db.add(db_contact)
-    db.commit()
-    db.refresh(db_contact)
+    await db.flush()
+    await db.refresh(db_contact)
 
-    contact = contact_crud.get_with_details(db, contact_id=db_contact.id)
-    lead_obj = lead_crud.get(db, id=lead.id)
-    source_obj = source_crud.get(db, id=contact_in.source_id)
     operator_obj = None
     if operator_id:
-        operator_obj = operator_crud.get(db, id=operator_id)
+        operator_obj = await async_operator_crud.get(db, id=operator_id)
+
+    response = ContactWithDetails(
+        id=db_contact.id,
+        lead_external_id=contact_in.lead_external_id,
+        source_id=contact_in.source_id,
+        message=contact_in.message,
+        lead_email=contact_in.lead_email,
+        lead_phone=contact_in.lead_phone,
+        lead_id=lead.id,
+        operator_id=operator_id,
+        is_active=db_contact.is_active,
+        created_at=db_contact.created_at,
+        lead=lead,
+        source=source,
+        operator=operator_obj
+    )
+    stored = None
+    if idempotency_key:
+        stored = await db.run_sync(
+            idempotency_store.add, idempotency_key, request_hash, 201,
+            response.model_dump(mode='json'))
+
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Параллельный запрос с тем же ключом успел сохранить свой ответ
+        await db.rollback()
+        if not idempotency_key:
+            raise
+        stored = await db.run_sync(idempotency_store.get, idempotency_key)
+        if not stored:
+            raise
+        return idempotency_store.replay(stored, request_hash)
+
+    lead_crud.remember(identity_keys(
+        contact_in.lead_external_id, contact_in.lead_email,
+        contact_in.lead_phone), lead.id)
+    async_distribution_service.remember_affinity(lead.id, operator_id)
+    if db_contact.is_open:
+        load_registry.increment(operator_id)
+    if stored:
+        idempotency_store.remember(idempotency_key, stored)
+    return response
+
+
+@router.post('/batch', response_model=ContactBatchResult, status_code=201)
+def create_contacts_batch(
+    contacts_in: List[ContactCreate],
+    db: Session = Depends(get_db)
+):
+    """Пакетное создание обращений с распределением в одной транзакции."""
+    source_ids = {contact_in.source_id for contact_in in contacts_in}
+    missing_source_ids = source_ids - get_existing_source_ids(db, source_ids)
+    if missing_source_ids:
+        raise HTTPException(
+            status_code=404,
+            detail=f'Sources not found: {sorted(missing_source_ids)}'
+        )
 
+    assignments = bulk_create_contacts(db, contacts_in)
+    assigned = sum(
+        1 for assignment in assignments if assignment['operator_id'])
     return {
-        'id': contact.id,
-        'lead_external_id': contact_in.lead_external_id,
-        'source_id': contact_in.source_id,
-        'message': contact_in.message,
-        'lead_email': contact_in.lead_email,
-        'lead_phone': contact_in.lead_phone,
-        'lead_id': lead.id,
-        'operator_id': operator_id,
-        'is_active': contact.is_active,
-        'created_at': contact.created_at,
-        'lead': lead_obj,
-        'source': source_obj,
-        'operator': operator_obj
+        'total': len(assignments),
+        'assigned': assigned,
+        'unassigned': len(assignments) - assigned,
+        'contacts': assignments
     }
 
 
+@router.post('/ingest', response_class=NDJSONStreamingResponse)
+async def ingest_contacts(request: Request):
+    """
+    Потоковая загрузка обращений в формате NDJSON (один ContactCreate
+    в строке).
+
+    Тело читается и разбирается по мере поступления, обращения
+    обрабатываются и коммитятся пачками по INGEST_CHUNK_SIZE строк, а
+    результат по каждой строке сразу отдается в ответ NDJSON, поэтому
+    расход памяти не зависит от размера файла.
+    """
+    return NDJSONStreamingResponse(ingest_ndjson(request.stream()))
+
+
 @router.get('/', response_model=List[ContactWithDetails])
-def read_contacts(
+async def read_contacts(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     source_id: Optional[int] = None,
     operator_id: Optional[int] = None,
     is_active: Optional[bool] = None,
-    db: Session = Depends(get_db)
+    cursor: Optional[int] = Depends(get_cursor),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    contacts = contact_crud.get_multi_with_details(
-        db,
+    """
+    Список обращений в порядке id. Для глубоких выборок вместо skip
+    передавайте cursor из заголовка X-Next-Cursor предыдущей страницы.
+    """
+    contacts = await db.run_sync(
+        contact_crud.get_multi_with_details,
         skip=skip,
-        limit=limit,
+        limit=limit + 1,
         source_id=source_id,
         operator_id=operator_id,
-        is_active=is_active
+        is_active=is_active,
+        after_id=cursor
     )
+    contacts = set_next_cursor(response, contacts, limit)
+    return [ContactWithDetails.from_contact(contact) for contact in contacts]
 
-    result = []
-    for contact in contacts:
-        lead = lead_crud.get(db, id=contact.lead_id)
-        source = source_crud.get(db, id=contact.source_id)
-        operator = None
-        if contact.operator_id:
-            operator = operator_crud.get(db, id=contact.operator_id)
-
-        contact_data = {
-            'id': contact.id,
-            'lead_external_id': lead.external_id if lead else "",
-            'source_id': contact.source_id,
-            'message': contact.message,
-            'lead_email': lead.email if lead else None,
-            'lead_phone': lead.phone if lead else None,
-            'lead_id': contact.lead_id,
-            'operator_id': contact.operator_id,
-            'is_active': contact.is_active,
-            'created_at': contact.created_at,
-            'lead': lead,
-            'source': source,
-            'operator': operator
-        }
-        result.append(contact_data)
 
-    return result
+@router.get('/export', response_class=StreamingResponse)
+def export_contacts_stream(
+    format: Literal['csv', 'ndjson'] = 'csv',
+    source_id: Optional[int] = None,
+    operator_id: Optional[int] = None,
+    is_active: Optional[bool] = None
+):
+    """
+    Полная выгрузка обращений в CSV или NDJSON с фильтрами списка.
+
+    Строки читаются из курсора БД пачками по EXPORT_BATCH_SIZE и сразу
+    отправляются клиенту.
+    """
+    return StreamingResponse(
+        export_contacts(
+            format,
+            source_id=source_id,
+            operator_id=operator_id,
+            is_active=is_active
+        ),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={
+            'Content-Disposition':
+            f'attachment; filename="contacts.{format}"'
+        }
+    )
 
 
 @router.patch('/{contact_id}/status')
@@ -136,8 +231,15 @@ def update_contact_status(
     contact = contact_crud.get(db, id=contact_id)
     if not contact:
         raise HTTPException(status_code=404, detail='Contact not found')
-    contact_crud.update(
-        db, db_obj=contact, obj_in={"is_active": status_data.is_active})
+    operator_id = contact.operator_id
+    load_delta = contact_crud.set_active(
+        db, contact=contact, is_active=status_data.is_active)
+    operator_crud.adjust_cached_load(
+        db, operator_id=operator_id, delta=load_delta)
+    db.commit()
+    load_registry.adjust(operator_id, load_delta)
+    if load_delta < 0:
+        redistribution_worker.trigger()
     return {
         'message':
         "Contact status updated to "
@@ -152,24 +254,4 @@ def read_contact(
     contact = contact_crud.get_with_details(db, contact_id=contact_id)
     if not contact:
         raise HTTPException(status_code=404, detail='Contact not found')
-    lead = lead_crud.get(db, id=contact.lead_id)
-    source = source_crud.get(db, id=contact.source_id)
-    operator = None
-    if contact.operator_id:
-        operator = operator_crud.get(db, id=contact.operator_id)
-
-    return {
-        'id': contact.id,
-        'lead_external_id': lead.external_id if lead else "",
-        'source_id': contact.source_id,
-        'message': contact.message,
-        'lead_email': lead.email if lead else None,
-        'lead_phone': lead.phone if lead else None,
-        'lead_id': contact.lead_id,
-        'operator_id': contact.operator_id,
-        'is_active': contact.is_active,
-        'created_at': contact.created_at,
-        'lead': lead,
-        'source': source,
-        'operator': operator
-    }
+    return ContactWithDetails.from_contact(contact)
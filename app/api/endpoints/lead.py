@@ -1,13 +1,14 @@
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
+from app.core.pagination import get_cursor, set_next_cursor
 from app.crud.contact import contact as contact_crud
 from app.crud.lead import lead as lead_crud
-from app.database.session import get_db
-from app.models.operator import Operator as OperatorModel
-from app.models.source import Source as SourceModel
+from app.database.session import get_async_db, get_db
 from app.schemas.lead import Lead
 from app.schemas.response import ContactWithDetails, LeadWithContacts
 
@@ -15,47 +16,30 @@ router = APIRouter()
 
 
 @router.get('/', response_model=List[Lead])
-def read_leads(
+async def read_leads(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
-    db: Session = Depends(get_db)
+    cursor: Optional[int] = Depends(get_cursor),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    return lead_crud.get_multi_with_contact_count(db, skip=skip, limit=limit)
+    leads = await db.run_sync(
+        lead_crud.get_multi_with_contact_count,
+        skip=skip, limit=limit + 1, after_id=cursor)
+    return set_next_cursor(response, leads, limit)
 
 
 @router.get('/{lead_id}', response_model=LeadWithContacts)
 def read_lead(
     lead_id: int,
+    include_archived: bool = False,
     db: Session = Depends(get_db)
 ):
     lead = lead_crud.get_with_contact_count(db, lead_id=lead_id)
     if not lead:
         raise HTTPException(status_code=404, detail='Lead not found')
-    contacts = contact_crud.get_by_lead_id(db, lead_id=lead_id)
-    enriched_contacts = []
-    for contact in contacts:
-        source = db.query(SourceModel).filter(
-            SourceModel.id == contact.source_id).first()
-        operator = None
-        if contact.operator_id:
-            operator = db.query(OperatorModel).filter(
-                OperatorModel.id == contact.operator_id).first()
-        contact_data = {
-            'id': contact.id,
-            'lead_external_id': lead.external_id,
-            'source_id': contact.source_id,
-            'message': contact.message,
-            'lead_email': lead.email,
-            'lead_phone': lead.phone,
-            'lead_id': contact.lead_id,
-            'operator_id': contact.operator_id,
-            'is_active': contact.is_active,
-            'created_at': contact.created_at,
-            'lead': lead,
-            'source': source,
-            'operator': operator
-        }
-        enriched_contacts.append(contact_data)
+    contacts = contact_crud.get_by_lead_id_with_details(
+        db, lead_id=lead_id, include_archived=include_archived)
 
     return {
         'id': lead.id,
@@ -64,48 +48,25 @@ def read_lead(
         'phone': lead.phone,
         'created_at': lead.created_at,
         'contact_count': lead.contact_count,
-        'contacts': enriched_contacts
+        'contacts': [
+            ContactWithDetails.from_contact(contact, lead=lead)
+            for contact in contacts
+        ]
     }
 
 
 @router.get('/by-external/{external_id}', response_model=LeadWithContacts)
 def read_lead_by_external_id(
     external_id: str,
+    include_archived: bool = False,
     db: Session = Depends(get_db)
 ):
     lead = lead_crud.get_by_external_id(db, external_id=external_id)
     if not lead:
         raise HTTPException(status_code=404, detail='Lead not found')
 
-    lead_with_count = lead_crud.get_with_contact_count(db, lead_id=lead.id)
-
-    contacts = contact_crud.get_by_lead_id(db, lead_id=lead.id)
-
-    enriched_contacts = []
-    for contact in contacts:
-        source = db.query(SourceModel).filter(
-            SourceModel.id == contact.source_id).first()
-        operator = None
-        if contact.operator_id:
-            operator = db.query(OperatorModel).filter(
-                OperatorModel.id == contact.operator_id).first()
-
-        contact_data = {
-            'id': contact.id,
-            'lead_external_id': lead.external_id,
-            'source_id': contact.source_id,
-            'message': contact.message,
-            'lead_email': lead.email,
-            'lead_phone': lead.phone,
-            'lead_id': contact.lead_id,
-            'operator_id': contact.operator_id,
-            'is_active': contact.is_active,
-            'created_at': contact.created_at,
-            'lead': lead_with_count,
-            'source': source,
-            'operator': operator
-        }
-        enriched_contacts.append(contact_data)
+    contacts = contact_crud.get_by_lead_id_with_details(
+        db, lead_id=lead.id, include_archived=include_archived)
 
     return {
         'id': lead.id,
@@ -113,46 +74,61 @@ def read_lead_by_external_id(
         'email': lead.email,
         'phone': lead.phone,
         'created_at': lead.created_at,
-        'contact_count': lead_with_count.contact_count,
-        'contacts': enriched_contacts
+        'contact_count': lead.contact_count,
+        'contacts': [
+            ContactWithDetails.from_contact(contact, lead=lead)
+            for contact in contacts
+        ]
     }
 
 
 @router.get('/{lead_id}/contacts', response_model=List[ContactWithDetails])
 def get_lead_contacts(
     lead_id: int,
+    include_archived: bool = False,
     db: Session = Depends(get_db)
 ):
     lead = lead_crud.get(db, id=lead_id)
     if not lead:
         raise HTTPException(status_code=404, detail="Lead not found")
 
-    contacts = contact_crud.get_by_lead_id(db, lead_id=lead_id)
-
-    result = []
-    for contact in contacts:
-        source = db.query(SourceModel).filter(
-            SourceModel.id == contact.source_id).first()
-        operator = None
-        if contact.operator_id:
-            operator = db.query(OperatorModel).filter(
-                OperatorModel.id == contact.operator_id).first()
-
-        contact_data = {
-            'id': contact.id,
-            'lead_external_id': lead.external_id,
-            'source_id': contact.source_id,
-            'message': contact.message,
-            'lead_email': lead.email,
-            'lead_phone': lead.phone,
-            'lead_id': contact.lead_id,
-            'operator_id': contact.operator_id,
-            'is_active': contact.is_active,
-            'created_at': contact.created_at,
-            'lead': lead,
-            'source': source,
-            'operator': operator
-        }
-        result.append(contact_data)
-
-    return result
+    contacts = contact_crud.get_by_lead_id_with_details(
+        db, lead_id=lead_id, include_archived=include_archived)
+
+    return [
+        ContactWithDetails.from_contact(contact, lead=lead)
+        for contact in contacts
+    ]
+
+
+@router.get('/{lead_id}/timeline', response_model=List[ContactWithDetails])
+def get_lead_timeline(
+    response: Response,
+    lead_id: int,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[int] = Depends(get_cursor),
+    source_id: Optional[int] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    include_archived: bool = False,
+    db: Session = Depends(get_db)
+):
+    """
+    Обращения лида от новых к старым постранично: следующая страница -
+    по cursor из заголовка X-Next-Cursor. created_from и created_to
+    ограничивают дату обращения (created_to не включительно).
+    """
+    contacts = contact_crud.get_lead_timeline(
+        db,
+        lead_id=lead_id,
+        limit=limit + 1,
+        after_id=cursor,
+        source_id=source_id,
+        created_from=created_from,
+        created_to=created_to,
+        include_archived=include_archived
+    )
+    if not contacts and not lead_crud.get(db, id=lead_id):
+        raise HTTPException(status_code=404, detail='Lead not found')
+    contacts = set_next_cursor(response, contacts, limit)
+    return [ContactWithDetails.from_contact(contact) for contact in contacts]
@@ -1,11 +1,14 @@
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
+from app.core.pagination import get_cursor, set_next_cursor
 from app.crud.contact import contact as contact_crud
 from app.crud.operator import operator as operator_crud
-from app.database.session import get_db
+from app.database.session import get_async_db, get_db
 from app.schemas.operator import (
     Operator,
     OperatorActivate,
@@ -13,6 +16,8 @@ from app.schemas.operator import (
     OperatorLoadLimit,
     OperatorUpdate,
 )
+from app.services.distribution import distribution_service
+from app.services.redistribution import redistribution_worker
 
 
 router = APIRouter()
@@ -23,16 +28,28 @@ def create_operator(
     operator_in: OperatorCreate,
     db: Session = Depends(get_db)
 ):
-    return operator_crud.create(db, obj_in=operator_in)
+    db_operator = operator_crud.create(db, obj_in=operator_in)
+    distribution_service.invalidate()
+    redistribution_worker.trigger()
+    return db_operator
 
 
 @router.get('/', response_model=List[Operator])
-def read_operators(
+async def read_operators(
+    response: Response,
     skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db)
+    limit: int = Query(100, ge=1, le=1000),
+    only_available: bool = Query(
+        False, description='Только активные операторы со свободными '
+                           'слотами (current_load < max_load)'),
+    cursor: Optional[int] = Depends(get_cursor),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    return operator_crud.get_multi_with_load(db, skip=skip, limit=limit)
+    operators = await db.run_sync(
+        operator_crud.get_multi_with_load,
+        skip=skip, limit=limit + 1, after_id=cursor,
+        only_available=only_available)
+    return set_next_cursor(response, operators, limit)
 
 
 @router.get('/{operator_id}', response_model=Operator)
@@ -55,7 +72,11 @@ def update_operator(
     db_operator = operator_crud.get(db, id=operator_id)
     if not db_operator:
         raise HTTPException(status_code=404, detail='Operator not found')
-    return operator_crud.update(db, db_obj=db_operator, obj_in=operator_in)
+    db_operator = operator_crud.update(
+        db, db_obj=db_operator, obj_in=operator_in)
+    distribution_service.invalidate()
+    redistribution_worker.trigger()
+    return db_operator
 
 
 @router.patch('/{operator_id}/activate')
@@ -70,6 +91,9 @@ def activate_operator(
 
     operator_crud.update(
         db, db_obj=db_operator, obj_in={'is_active': activate_data.active})
+    distribution_service.invalidate()
+    if activate_data.active:
+        redistribution_worker.trigger()
 
     status = 'activated' if activate_data.active else 'deactivated'
     return {'message': f'Operator {status}'}
@@ -85,8 +109,12 @@ def set_load_limit(
     if not db_operator:
         raise HTTPException(status_code=404, detail='Operator not found')
 
+    previous_max_load = db_operator.max_load
     operator_crud.update(
         db, db_obj=db_operator, obj_in={'max_load': load_data.max_load})
+    distribution_service.invalidate()
+    if load_data.max_load > previous_max_load:
+        redistribution_worker.trigger()
 
     return {'message': 'Load limit set to {load_data.max_load}'}
 
@@ -94,29 +122,24 @@ def set_load_limit(
 @router.get('/{operator_id}/stats')
 def get_operator_stats(
     operator_id: int,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
     db: Session = Depends(get_db)
 ):
+    """
+    Обращения оператора по источникам, с created_from и created_to -
+    только за этот период (created_to не включительно).
+    """
     db_operator = operator_crud.get_with_load(db, operator_id=operator_id)
     if not db_operator:
         raise HTTPException(status_code=404, detail='Operator not found')
 
-    contacts = contact_crud.get_by_operator_id(db, operator_id=operator_id)
-
-    from collections import defaultdict
-    source_stats = defaultdict(int)
-    for contact in contacts:
-        source_stats[contact.source_id] += 1
-
-    from app.models.source import Source
-    source_details = []
-    for source_id, count in source_stats.items():
-        source = db.query(Source).filter(Source.id == source_id).first()
-        if source:
-            source_details.append({
-                'source_id': source_id,
-                'source_name': source.name,
-                'count': count
-            })
+    source_stats = contact_crud.get_operator_stats_by_source(
+        db,
+        operator_id=operator_id,
+        created_from=created_from,
+        created_to=created_to
+    )
 
     return {
         'operator': {
@@ -126,9 +149,17 @@ def get_operator_stats(
             'max_load': db_operator.max_load,
             'current_load': db_operator.current_load
         },
-        'contacts_total': len(contacts),
-        'contacts_active': len([c for c in contacts if c.is_active]),
-        'by_source': source_details
+        'contacts_total': sum(stat.total_contacts for stat in source_stats),
+        'contacts_active': sum(
+            stat.active_contacts or 0 for stat in source_stats),
+        'by_source': [
+            {
+                'source_id': stat.source_id,
+                'source_name': stat.source_name,
+                'count': stat.total_contacts
+            }
+            for stat in source_stats
+        ]
     }
 
 
@@ -142,4 +173,5 @@ def delete_operator(
         raise HTTPException(status_code=404, detail='Operator not found')
 
     operator_crud.remove(db, id=operator_id)
+    distribution_service.invalidate()
     return {'message': 'Operator deleted successfully'}
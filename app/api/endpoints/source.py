@@ -1,10 +1,12 @@
 from typing import List
 
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
+from app.crud.source import async_source as async_source_crud
 from app.crud.source import source as source_crud
-from app.database.session import get_db
+from app.database.session import get_async_db, get_db
 from app.models.operator import Operator
 from app.models.source import SourceOperatorWeight as WeightModel
 from app.schemas.response import SourceWithWeights
@@ -14,6 +16,8 @@ from app.schemas.source import (
     SourceOperatorWeight,
     SourceOperatorWeightCreate,
 )
+from app.services.distribution import distribution_service
+from app.services.redistribution import redistribution_worker
 
 router = APIRouter()
 
@@ -27,12 +31,12 @@ def create_source(
 
 
 @router.get('/', response_model=List[Source])
-def read_sources(
+async def read_sources(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    return source_crud.get_multi(db, skip=skip, limit=limit)
+    return await async_source_crud.get_multi(db, skip=skip, limit=limit)
 
 
 @router.get('/{source_id}', response_model=SourceWithWeights)
@@ -81,6 +85,11 @@ def set_source_weights(
     if not source:
         raise HTTPException(status_code=404, detail='Source not found')
 
+    operator_ids = [weight.operator_id for weight in weights]
+    if len(operator_ids) != len(set(operator_ids)):
+        raise HTTPException(
+            status_code=400, detail='Duplicate operator_id in weights')
+
     for weight in weights:
         operator = db.query(Operator).filter(
             Operator.id == weight.operator_id).first()
@@ -103,6 +112,8 @@ def set_source_weights(
         result.append(db_weight)
 
     db.commit()
+    distribution_service.invalidate(source_id)
+    redistribution_worker.trigger()
 
     for i, weight in enumerate(result):
         db.refresh(result[i])
@@ -1,14 +1,19 @@
+from typing import Dict
+
 from sqlalchemy import func
 from sqlalchemy.orm import Session
 from fastapi import APIRouter, Depends
 
 from app.crud.contact import contact as contact_crud
+from app.crud.lead import lead as lead_crud
 from app.database.session import get_db
 from app.models.contact import Contact
 from app.models.lead import Lead
 from app.models.operator import Operator
 from app.models.source import Source
-from app.schemas.stats import DistributionStats
+from app.schemas.stats import CacheStats, DistributionStats
+from app.services.distribution import distribution_service
+from app.services.idempotency import idempotency_store
 
 router = APIRouter()
 
@@ -72,3 +77,15 @@ def get_distribution_stats(
             'operators_total': operators_total or 0
         }
     }
+
+
+@router.get('/cache', response_model=Dict[str, CacheStats])
+def get_cache_stats():
+    """Размер и попадания кэшей в памяти процесса."""
+    caches = {
+        'lead_resolution': lead_crud.cache,
+        'idempotency': idempotency_store.cache,
+    }
+    if distribution_service.affinity is not None:
+        caches['distribution_affinity'] = distribution_service.affinity
+    return {name: cache.stats() for name, cache in caches.items()}
@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 
 from pydantic_settings import BaseSettings
 
@@ -9,6 +9,58 @@ class Settings(BaseSettings):
     API_V1_STR: str = '/api/v1'
     # Database
     DATABASE_URL: str = 'sqlite:///./crm.db'
+    # По умолчанию выводится из DATABASE_URL (aiosqlite / asyncpg)
+    ASYNC_DATABASE_URL: Optional[str] = None
+    # SQLite: сколько ждать блокировку записи, мс
+    SQLITE_BUSY_TIMEOUT: int = 30_000
+    # Distribution
+    # Стратегия распределения: 'weighted', 'round_robin', 'least_loaded'
+    DISTRIBUTION_STRATEGY: str = 'weighted'
+    # Период сохранения состояния стратегии (курсоров round-robin), сек
+    DISTRIBUTION_STATE_FLUSH_INTERVAL: int = 10
+    # Откуда стратегии берут нагрузку операторов: 'registry' - реестр
+    # в памяти процесса, 'db' - агрегирующий запрос при каждом выборе
+    # (для запуска в несколько процессов)
+    DISTRIBUTION_LOAD_SOURCE: str = 'registry'
+    # Срок жизни таблицы выбора weighted и кольца round_robin, сек: изменения
+    # весов и операторов из других процессов подхватываются не позже него
+    DISTRIBUTION_TABLE_TTL: int = 30
+    # Период сверки реестра нагрузки операторов с БД, сек (0 - отключено)
+    LOAD_RECONCILE_INTERVAL: int = 60
+    # Привязка повторных обращений лида к его предыдущему оператору
+    DISTRIBUTION_AFFINITY_ENABLED: bool = False
+    DISTRIBUTION_AFFINITY_TTL: int = 24 * 60 * 60
+    DISTRIBUTION_AFFINITY_SIZE: int = 100_000
+    # Очередь обращений без оператора: размер пачки и период страховочного
+    # прохода, сек (основной запуск - при освобождении емкости)
+    REDISTRIBUTION_BATCH_SIZE: int = 500
+    REDISTRIBUTION_INTERVAL: int = 300
+    # Потоковая загрузка обращений: строк NDJSON в одной транзакции и
+    # максимальная длина строки, байт (длинные строки отклоняются)
+    INGEST_CHUNK_SIZE: int = 500
+    INGEST_MAX_LINE_LENGTH: int = 64 * 1024
+    # Выгрузка обращений: строк, читаемых из курсора БД за раз
+    EXPORT_BATCH_SIZE: int = 1000
+    # Idempotency-Key: срок хранения ответа, сек, размер кэша в памяти
+    # и период удаления просроченных ключей, сек (0 - отключено)
+    IDEMPOTENCY_TTL: int = 24 * 60 * 60
+    IDEMPOTENCY_CACHE_SIZE: int = 10_000
+    IDEMPOTENCY_CLEANUP_INTERVAL: int = 60 * 60
+    # Архивация закрытых обращений старше ARCHIVE_AFTER_DAYS дней: размер
+    # пачки (одна транзакция) и период запуска, сек (0 - отключено)
+    ARCHIVE_AFTER_DAYS: int = 30
+    ARCHIVE_BATCH_SIZE: int = 1000
+    ARCHIVE_INTERVAL: int = 60 * 60
+    # Leads
+    # Код страны для телефонов без него при нормализации в E.164
+    PHONE_DEFAULT_COUNTRY_CODE: str = '7'
+    # Склейка дублей лидов по телефону и email: размер пачки и период
+    # запуска, сек (0 - отключено)
+    LEAD_DEDUP_BATCH_SIZE: int = 1000
+    LEAD_DEDUP_INTERVAL: int = 60 * 60
+    # Кэш идентификатор лида -> id лида перед поиском при приеме обращений
+    LEAD_CACHE_SIZE: int = 100_000
+    LEAD_CACHE_TTL: int = 10 * 60
     # CORS
     BACKEND_CORS_ORIGINS: List[str] = ['http://localhost:3000']
 
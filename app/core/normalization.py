@@ -0,0 +1,56 @@
+import re
+from typing import List, Optional, Tuple
+
+from app.core.config import settings
+
+# Виды идентификаторов лида в порядке приоритета при сопоставлении
+IDENTITY_KINDS = ('external_id', 'phone', 'email')
+
+IdentityKey = Tuple[str, str]
+
+
+def normalize_phone(
+    phone: Optional[str],
+    default_country_code: str = settings.PHONE_DEFAULT_COUNTRY_CODE
+) -> Optional[str]:
+    """
+    Телефон в формате E.164 (+79991234567) или None, если строка не
+    похожа на номер. Номер без кода страны дополняется
+    default_country_code, для кода 7 учитывается префикс 8.
+    """
+    if not phone:
+        return None
+    phone = phone.strip()
+    digits = re.sub(r'\D', '', phone)
+    if phone.startswith('00'):
+        digits = digits[2:]
+    elif not phone.startswith('+'):
+        if (default_country_code == '7' and len(digits) == 11
+                and digits.startswith('8')):
+            digits = '7' + digits[1:]
+        elif len(digits) == 10:
+            digits = default_country_code + digits
+    if not 8 <= len(digits) <= 15:
+        return None
+    return '+' + digits
+
+
+def normalize_email(email: Optional[str]) -> Optional[str]:
+    """Email без пробелов в нижнем регистре или None."""
+    if not email:
+        return None
+    email = email.strip().lower()
+    return email if '@' in email else None
+
+
+def identity_keys(
+    external_id: str, email: Optional[str] = None,
+    phone: Optional[str] = None
+) -> List[IdentityKey]:
+    """Идентификаторы лида (вид, значение) в порядке приоритета."""
+    values = {
+        'external_id': external_id,
+        'phone': normalize_phone(phone),
+        'email': normalize_email(email),
+    }
+    return [(kind, values[kind]) for kind in IDENTITY_KINDS if values[kind]]
@@ -0,0 +1,55 @@
+import base64
+import binascii
+import json
+from typing import List, Optional, Sequence, TypeVar
+
+from fastapi import HTTPException, Query, Response
+
+ItemType = TypeVar('ItemType')
+
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+def encode_cursor(last_id: int) -> str:
+    """Непрозрачный курсор страницы: id последней выданной записи."""
+    payload = json.dumps({'id': last_id}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> int:
+    """Разобрать курсор, ValueError если он поврежден."""
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        last_id = json.loads(payload)['id']
+    except (binascii.Error, UnicodeDecodeError, TypeError, KeyError) as error:
+        raise ValueError('Invalid cursor') from error
+    if not isinstance(last_id, int):
+        raise ValueError('Invalid cursor')
+    return last_id
+
+
+def get_cursor(
+    cursor: Optional[str] = Query(
+        None, description=f'Значение заголовка {NEXT_CURSOR_HEADER} '
+                          'предыдущей страницы')
+) -> Optional[int]:
+    """Зависимость FastAPI: id, после которого начинается страница."""
+    if cursor is None:
+        return None
+    try:
+        return decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+
+
+def set_next_cursor(
+    response: Response, items: Sequence[ItemType], limit: int
+) -> List[ItemType]:
+    """
+    Обрезать выборку из limit + 1 записей до limit и, если есть
+    следующая страница, отдать ее курсор в заголовке X-Next-Cursor.
+    """
+    if len(items) > limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+            items[limit - 1].id)
+    return list(items[:limit])
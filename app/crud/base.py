@@ -2,11 +2,32 @@ from typing import Any, Dict, Generic, List, Optional, Type, TypeVar, Union
 
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy import Select, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Query, Session
 
 ModelType = TypeVar('ModelType', bound=Any)
 CreateSchemaType = TypeVar('CreateSchemaType', bound=BaseModel)
 UpdateSchemaType = TypeVar('UpdateSchemaType', bound=BaseModel)
+QueryType = TypeVar('QueryType', Query, Select)
+
+
+def paginate(
+    query: QueryType, key: Any, *, skip: int = 0, limit: int = 100,
+    after_id: Optional[int] = None, descending: bool = False
+) -> QueryType:
+    """
+    Страница выборки (Query или select()) в порядке key (с descending -
+    в обратном). Если передан after_id, страница начинается после него
+    (keyset) и ее стоимость не зависит от глубины, иначе используется
+    OFFSET skip.
+    """
+    query = query.order_by(key.desc() if descending else key)
+    if after_id is not None:
+        query = query.filter(key < after_id if descending else key > after_id)
+    else:
+        query = query.offset(skip)
+    return query.limit(limit)
 
 
 class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
@@ -17,9 +38,13 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         return db.query(self.model).filter(self.model.id == id).first()
 
     def get_multi(
-        self, db: Session, skip: int = 0, limit: int = 100
+        self, db: Session, skip: int = 0, limit: int = 100,
+        after_id: Optional[int] = None
     ) -> List[ModelType]:
-        return db.query(self.model).offset(skip).limit(limit).all()
+        return paginate(
+            db.query(self.model), self.model.id,
+            skip=skip, limit=limit, after_id=after_id
+        ).all()
 
     def create(self, db: Session, obj_in: CreateSchemaType) -> ModelType:
         obj_in_data = jsonable_encoder(obj_in)
@@ -53,3 +78,57 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         db.delete(obj)
         db.commit()
         return obj
+
+
+class AsyncCRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
+    """Асинхронный вариант CRUDBase для AsyncSession."""
+
+    def __init__(self, model: Type[ModelType]):
+        self.model = model
+
+    async def get(self, db: AsyncSession, id: int) -> Optional[ModelType]:
+        return await db.get(self.model, id)
+
+    async def get_multi(
+        self, db: AsyncSession, skip: int = 0, limit: int = 100,
+        after_id: Optional[int] = None
+    ) -> List[ModelType]:
+        result = await db.scalars(paginate(
+            select(self.model), self.model.id,
+            skip=skip, limit=limit, after_id=after_id))
+        return list(result)
+
+    async def create(
+        self, db: AsyncSession, obj_in: CreateSchemaType
+    ) -> ModelType:
+        obj_in_data = jsonable_encoder(obj_in)
+        db_obj = self.model(**obj_in_data)
+        db.add(db_obj)
+        await db.commit()
+        await db.refresh(db_obj)
+        return db_obj
+
+    async def update(
+        self, db: AsyncSession, db_obj: ModelType,
+        obj_in: Union[UpdateSchemaType, Dict[str, Any]]
+    ) -> ModelType:
+        obj_data = jsonable_encoder(db_obj)
+        if isinstance(obj_in, dict):
+            update_data = obj_in
+        else:
+            update_data = obj_in.dict(exclude_unset=True)
+
+        for field in obj_data:
+            if field in update_data:
+                setattr(db_obj, field, update_data[field])
+
+        db.add(db_obj)
+        await db.commit()
+        await db.refresh(db_obj)
+        return db_obj
+
+    async def remove(self, db: AsyncSession, id: int) -> ModelType:
+        obj = await db.get(self.model, id)
+        await db.delete(obj)
+        await db.commit()
+        return obj
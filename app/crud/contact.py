@@ -1,17 +1,95 @@
-from typing import Dict, List, Optional
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Union
 
-from sqlalchemy import case, func
-from sqlalchemy.orm import Session
+from sqlalchemy import Row, case, func
+from sqlalchemy.orm import Query, Session, joinedload
 
-from app.crud.base import CRUDBase
-from app.models.contact import Contact
+from app.crud.base import CRUDBase, paginate
+from app.models.contact import OPEN_STATUSES, Contact, ContactArchive
+from app.models.lead import Lead
+from app.models.source import Source
 from app.schemas.contact import ContactCreate, ContactUpdate
 
 
+# Связанные объекты, которые отдаются вместе с обращением
+DETAILS_OPTIONS = (
+    joinedload(Contact.lead),
+    joinedload(Contact.source),
+    joinedload(Contact.operator),
+)
+
+
+# Колонки выгрузки обращений
+EXPORT_COLUMNS = (
+    Contact.id,
+    Contact.lead_id,
+    Lead.external_id.label('lead_external_id'),
+    Lead.email.label('lead_email'),
+    Lead.phone.label('lead_phone'),
+    Contact.source_id,
+    Contact.operator_id,
+    Contact.status,
+    Contact.is_active,
+    Contact.message,
+    Contact.created_at,
+)
+
+
 class CRUDContact(CRUDBase[Contact, ContactCreate, ContactUpdate]):
     def get_by_lead_id(self, db: Session, *, lead_id: int) -> List[Contact]:
         return db.query(Contact).filter(Contact.lead_id == lead_id).all()
 
+    def get_by_lead_id_with_details(
+        self, db: Session, *, lead_id: int, include_archived: bool = False
+    ) -> List[Union[Contact, ContactArchive]]:
+        """
+        Обращения лида в порядке id, с include_archived - вместе с
+        перенесенными в архив.
+        """
+        contacts = db.query(Contact).options(*DETAILS_OPTIONS).filter(
+            Contact.lead_id == lead_id).order_by(Contact.id).all()
+        if not include_archived:
+            return contacts
+        archived = db.query(ContactArchive).options(
+            joinedload(ContactArchive.lead),
+            joinedload(ContactArchive.source),
+            joinedload(ContactArchive.operator),
+        ).filter(ContactArchive.lead_id == lead_id).all()
+        return sorted(contacts + archived, key=lambda contact: contact.id)
+
+    def get_lead_timeline(
+        self, db: Session, *, lead_id: int, limit: int = 100,
+        after_id: Optional[int] = None, source_id: Optional[int] = None,
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None,
+        include_archived: bool = False
+    ) -> List[Union[Contact, ContactArchive]]:
+        """
+        Страница обращений лида от новых к старым: один запрос по индексу
+        (lead_id, id) со связанными объектами, с include_archived - еще
+        один такой же по архиву.
+        """
+        models = (Contact, ContactArchive) if include_archived else (Contact,)
+        contacts = []
+        for model in models:
+            query = db.query(model).options(
+                joinedload(model.lead),
+                joinedload(model.source),
+                joinedload(model.operator),
+            ).filter(model.lead_id == lead_id)
+            if source_id:
+                query = query.filter(model.source_id == source_id)
+            if created_from:
+                query = query.filter(model.created_at >= created_from)
+            if created_to:
+                query = query.filter(model.created_at < created_to)
+            contacts += paginate(
+                query, model.id, limit=limit, after_id=after_id,
+                descending=True
+            ).all()
+        contacts.sort(key=lambda contact: contact.id, reverse=True)
+        return contacts[:limit]
+
     def get_by_operator_id(
         self, db: Session, *, operator_id: int
     ) -> List[Contact]:
@@ -31,24 +109,122 @@ class CRUDContact(CRUDBase[Contact, ContactCreate, ContactUpdate]):
     ) -> List[Contact]:
         return db.query(Contact).filter(Contact.source_id == source_id).all()
 
+    def set_active(
+        self, db: Session, *, contact: Contact, is_active: bool
+    ) -> int:
+        """
+        Изменить is_active условным UPDATE: строка меняется, только если
+        параллельный запрос не изменил ее раньше; при закрытии
+        запоминается closed_at. Не коммитит. Возвращает
+        изменение нагрузки оператора (-1, 0 или 1).
+        """
+        changed = db.query(Contact).filter(
+            Contact.id == contact.id,
+            Contact.is_active == (not is_active)
+        ).update({
+            Contact.is_active: is_active,
+            Contact.closed_at: None if is_active else func.now(),
+        }, synchronize_session=False)
+        if not changed or (contact.status or 'new') not in OPEN_STATUSES:
+            return 0
+        return 1 if is_active else -1
+
     def get_with_details(
         self, db: Session, *, contact_id: int
     ) -> Optional[Contact]:
-        return db.query(Contact).filter(Contact.id == contact_id).first()
+        return db.query(Contact).options(*DETAILS_OPTIONS).filter(
+            Contact.id == contact_id).first()
 
     def get_multi_with_details(self, db: Session, *, skip: int = 0,
         limit: int = 100, source_id: Optional[int] = None,
         operator_id: Optional[int] = None,
-        is_active: Optional[bool] = None
+        is_active: Optional[bool] = None,
+        after_id: Optional[int] = None
     ) -> List[Contact]:
-        query = db.query(Contact)
+        query = self._filter(
+            db.query(Contact).options(*DETAILS_OPTIONS),
+            source_id=source_id,
+            operator_id=operator_id,
+            is_active=is_active
+        )
+        return paginate(
+            query, Contact.id, skip=skip, limit=limit, after_id=after_id
+        ).all()
+
+    def iter_export_rows(
+        self, db: Session, *, source_id: Optional[int] = None,
+        operator_id: Optional[int] = None,
+        is_active: Optional[bool] = None,
+        batch_size: int = 1000
+    ) -> Iterator[Row]:
+        """
+        Плоские строки обращений с данными лида в порядке id. Строки
+        читаются из курсора БД пачками по batch_size (yield_per), без
+        создания ORM-объектов.
+        """
+        query = db.query(
+            *EXPORT_COLUMNS
+        ).join(Lead, Lead.id == Contact.lead_id)
+        query = self._filter(
+            query,
+            source_id=source_id,
+            operator_id=operator_id,
+            is_active=is_active
+        )
+        return iter(query.order_by(Contact.id).yield_per(batch_size))
+
+    def _filter(
+        self, query: Query, *, source_id: Optional[int] = None,
+        operator_id: Optional[int] = None,
+        is_active: Optional[bool] = None
+    ) -> Query:
         if source_id:
             query = query.filter(Contact.source_id == source_id)
         if operator_id:
             query = query.filter(Contact.operator_id == operator_id)
         if is_active is not None:
             query = query.filter(Contact.is_active == is_active)
-        return query.offset(skip).limit(limit).all()
+        return query
+
+    def get_unassigned(
+        self, db: Session, *, limit: int = 500,
+        excluded_source_ids: Optional[Iterable[int]] = None
+    ) -> List[Contact]:
+        """Открытые обращения без оператора в порядке поступления."""
+        query = db.query(Contact).filter(
+            Contact.operator_id.is_(None),
+            Contact.is_open
+        )
+        if excluded_source_ids:
+            query = query.filter(Contact.source_id.notin_(excluded_source_ids))
+        return query.order_by(
+            Contact.created_at, Contact.id).limit(limit).all()
+
+    def assign_operator(
+        self, db: Session, *, contact_id: int, operator_id: int
+    ) -> bool:
+        """
+        Назначить оператора открытому обращению без оператора условным
+        UPDATE. False, если обращение уже назначили или закрыли
+        параллельно. Не коммитит.
+        """
+        return bool(db.query(Contact).filter(
+            Contact.id == contact_id,
+            Contact.operator_id.is_(None),
+            Contact.is_open
+        ).update({Contact.operator_id: operator_id},
+                 synchronize_session=False))
+
+    def get_open_load_by_operator(self, db: Session) -> Dict[int, int]:
+        """Количество открытых обращений по каждому оператору."""
+        stats = db.query(
+            Contact.operator_id,
+            func.count(Contact.id).label('open_contacts')
+        ).filter(
+            Contact.operator_id.isnot(None),
+            Contact.is_open
+        ).group_by(Contact.operator_id).all()
+        return {stat.operator_id: stat.open_contacts for stat in stats}
 
     def get_stats_by_operator(self, db: Session) -> Dict:
         stats = db.query(
@@ -78,5 +254,29 @@ class CRUDContact(CRUDBase[Contact, ContactCreate, ContactUpdate]):
             for stat in stats
         }
 
+    def get_operator_stats_by_source(
+        self, db: Session, *, operator_id: int,
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None
+    ) -> List[Row]:
+        """
+        Обращения оператора по источникам одним запросом GROUP BY:
+        source_id, source_name, total_contacts, active_contacts.
+        """
+        query = db.query(
+            Source.id.label('source_id'),
+            Source.name.label('source_name'),
+            func.count(Contact.id).label('total_contacts'),
+            func.sum(case((Contact.is_active == True, 1), else_=0))
+            .label('active_contacts')
+        ).join(Source, Source.id == Contact.source_id).filter(
+            Contact.operator_id == operator_id)
+        if created_from:
+            query = query.filter(Contact.created_at >= created_from)
+        if created_to:
+            query = query.filter(Contact.created_at < created_to)
+        return query.group_by(Source.id, Source.name).order_by(
+            Source.id).all()
+
 
 contact = CRUDContact(Contact)
@@ -1,60 +1,399 @@
-from typing import List, Optional
+from typing import Dict, Iterable, List, Optional, Tuple, Type
 
-from sqlalchemy import func
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import (
+    and_, bindparam, func, or_, select, tuple_, update)
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
 
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.normalization import IdentityKey, identity_keys
 from app.crud.base import CRUDBase
-from app.models.contact import Contact
-from app.models.lead import Lead
+from app.models.contact import Contact, ContactArchive
+from app.models.lead import Lead, LeadIdentity
 from app.schemas.lead import LeadCreate, LeadUpdate
 
 
+# INSERT с поддержкой ON CONFLICT по диалектам
+UPSERT_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
 class CRUDLead(CRUDBase[Lead, LeadCreate, LeadUpdate]):
+    def __init__(self, model: Type[Lead], cache: TTLCache[int]):
+        super().__init__(model)
+        # Идентификатор лида (вид, значение) -> id лида. Заполняется только
+        # закоммиченными данными и сбрасывается при склейке лидов
+        self.cache = cache
+
+    def get_cached_id(self, keys: Iterable[IdentityKey]) -> Optional[int]:
+        """id лида, если все идентификаторы keys закэшированы за ним."""
+        lead_id = None
+        for key in keys:
+            cached = self.cache.get(key)
+            if cached is None or lead_id not in (None, cached):
+                return None
+            lead_id = cached
+        return lead_id
+
+    def remember(self, keys: Iterable[IdentityKey], lead_id: int) -> None:
+        """Закэшировать идентификаторы лида после коммита транзакции."""
+        for key in keys:
+            self.cache.set(key, lead_id)
+
+    def invalidate(self, keys: Iterable[IdentityKey]) -> None:
+        for key in keys:
+            self.cache.delete(key)
+
     def get_by_external_id(
         self, db: Session, *, external_id: str
     ) -> Optional[Lead]:
-        return db.query(Lead).filter(Lead.external_id == external_id).first()
+        """
+        Лид по external_id, в том числе по external_id склеенных дублей.
+        При попадании в кэш лид читается по первичному ключу.
+        """
+        key = ('external_id', external_id)
+        lead_id = self.cache.get(key)
+        if lead_id is not None:
+            lead = db.get(Lead, lead_id)
+            if lead is not None:
+                return lead
+            self.cache.delete(key)
+        lead = db.query(Lead).join(
+            LeadIdentity, LeadIdentity.lead_id == Lead.id
+        ).filter(
+            LeadIdentity.kind == 'external_id',
+            LeadIdentity.value == external_id
+        ).first()
+        if lead is not None:
+            self.cache.set(key, lead.id)
+        return lead
+
+    def match_identities(
+        self, db: Session, *, keys: Iterable[IdentityKey]
+    ) -> Dict[IdentityKey, Lead]:
+        """Лиды, которым принадлежат идентификаторы keys, одним запросом."""
+        keys = list(keys)
+        if not keys:
+            return {}
+        rows = db.query(LeadIdentity.kind, LeadIdentity.value, Lead).join(
+            Lead, Lead.id == LeadIdentity.lead_id
+        ).filter(tuple_(LeadIdentity.kind, LeadIdentity.value).in_(keys))
+        return {(kind, value): lead for kind, value, lead in rows}
+
+    def add_identities(
+        self, db: Session, *, identities: Iterable[Tuple[int, str, str]]
+    ) -> None:
+        """
+        Привязать идентификаторы (lead_id, вид, значение) к лидам.
+        Идентификаторы, уже принадлежащие какому-либо лиду, пропускаются.
+        Изменения не коммитятся.
+        """
+        rows = [
+            {'lead_id': lead_id, 'kind': kind, 'value': value}
+            for lead_id, kind, value in identities
+        ]
+        if not rows:
+            return
+        dialect_insert = UPSERT_INSERTS.get(db.get_bind().dialect.name)
+        if dialect_insert is None:
+            existing = self.match_identities(
+                db, keys=[(row['kind'], row['value']) for row in rows])
+            rows = [
+                row for row in rows
+                if (row['kind'], row['value']) not in existing
+            ]
+            db.add_all(LeadIdentity(**row) for row in rows)
+            db.flush()
+            return
+        db.execute(
+            dialect_insert(LeadIdentity).on_conflict_do_nothing(
+                index_elements=['kind', 'value']),
+            rows
+        )
 
     def get_or_create(
         self, db: Session, *, external_id: str,
         email: Optional[str] = None, phone: Optional[str] = None
     ) -> Lead:
-        lead = self.get_by_external_id(db, external_id=external_id)
+        """
+        Найти лида по любому из его идентификаторов (external_id, телефон
+        в E.164, email в нижнем регистре) одним запросом к
+        lead_identities или создать его. Переданные email и phone
+        обновляют найденного лида, новые идентификаторы привязываются к
+        нему. Изменения не коммитятся.
+        """
+        keys = identity_keys(external_id, email, phone)
+        matches = self.match_identities(db, keys=keys)
+        lead = next((matches[key] for key in keys if key in matches), None)
+        if lead is None:
+            lead = self._upsert(
+                db, external_id=external_id, email=email, phone=phone)
+        else:
+            if email:
+                lead.email = email
+            if phone:
+                lead.phone = phone
+            db.flush()
+        self.add_identities(db, identities=[
+            (lead.id, kind, value)
+            for kind, value in keys if (kind, value) not in matches
+        ])
+        return lead
+
+    def get_or_create_for_contact(
+        self, db: Session, *, external_id: str,
+        email: Optional[str] = None, phone: Optional[str] = None
+    ) -> Lead:
+        """
+        Лид нового обращения с уже увеличенным contact_count. Если все
+        идентификаторы лида есть в кэше, поиск не выполняется: лид
+        обновляется и читается одним UPDATE ... RETURNING. Изменения не
+        коммитятся, кэш пополняется вызовом remember() после коммита.
+        """
+        keys = identity_keys(external_id, email, phone)
+        lead = None
+        lead_id = self.get_cached_id(keys)
+        if lead_id is not None:
+            lead = self.record_contact(
+                db, lead_id=lead_id, email=email, phone=phone)
+            if lead is None:
+                self.invalidate(keys)
+        if lead is None:
+            lead_id = self.get_or_create(
+                db, external_id=external_id, email=email, phone=phone).id
+            lead = self.record_contact(
+                db, lead_id=lead_id, email=email, phone=phone)
+        return lead
+
+    def record_contact(
+        self, db: Session, *, lead_id: int,
+        email: Optional[str] = None, phone: Optional[str] = None
+    ) -> Optional[Lead]:
+        """
+        Увеличить contact_count лида на 1 и обновить переданные email и
+        phone одним запросом. Возвращает лида или None, если его нет.
+        """
+        values = {'contact_count': Lead.contact_count + 1}
+        if email:
+            values['email'] = email
+        if phone:
+            values['phone'] = phone
+        stmt = update(Lead).where(Lead.id == lead_id).values(
+            **values).execution_options(synchronize_session=False)
+        if not db.get_bind().dialect.update_returning:
+            db.execute(stmt)
+            return db.get(Lead, lead_id, populate_existing=True)
+        return db.scalars(
+            stmt.returning(Lead),
+            execution_options={'populate_existing': True}
+        ).one_or_none()
+
+    def _upsert(
+        self, db: Session, *, external_id: str,
+        email: Optional[str] = None, phone: Optional[str] = None
+    ) -> Lead:
+        """
+        Создать лида одним запросом INSERT ... ON CONFLICT DO UPDATE ...
+        RETURNING: при гонке с параллельным запросом вернется уже
+        созданный лид с обновленными email и phone. Пустые email и phone
+        не затирают сохраненные значения.
+        """
+        email, phone = email or None, phone or None
+        dialect_insert = UPSERT_INSERTS.get(db.get_bind().dialect.name)
+        if dialect_insert is None:
+            return self._upsert_portable(
+                db, external_id=external_id, email=email, phone=phone)
+        stmt = dialect_insert(Lead).values(
+            external_id=external_id, email=email, phone=phone)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Lead.external_id],
+            set_={
+                'email': func.coalesce(stmt.excluded.email, Lead.email),
+                'phone': func.coalesce(stmt.excluded.phone, Lead.phone),
+            }
+        ).returning(Lead)
+        return db.scalars(
+            stmt, execution_options={'populate_existing': True}).one()
+
+    def _upsert_portable(
+        self, db: Session, *, external_id: str,
+        email: Optional[str] = None, phone: Optional[str] = None
+    ) -> Lead:
+        lead = db.query(Lead).filter(Lead.external_id == external_id).first()
         if not lead:
-            lead_in = LeadCreate(
-                external_id=external_id, email=email, phone=phone)
-            lead = self.create(db, obj_in=lead_in)
-        elif email or phone:
-            update_data = {}
+            lead = Lead(external_id=external_id, email=email, phone=phone)
+            db.add(lead)
+        else:
             if email:
-                update_data['email'] = email
+                lead.email = email
             if phone:
-                update_data['phone'] = phone
-            if update_data:
-                lead = self.update(db, db_obj=lead, obj_in=update_data)
+                lead.phone = phone
+        db.flush()
         return lead
 
+    def get_or_create_many(
+        self, db: Session, *, leads_in: Iterable[LeadCreate],
+        chunk_size: int = 500
+    ) -> Dict[str, Lead]:
+        """
+        Найти или создать лидов пачкой: идентификаторы всех лидов
+        сопоставляются запросами IN по chunk_size штук, лиды с общим
+        телефоном или email внутри пачки склеиваются. Изменения не
+        коммитятся, новые лиды только отправляются в БД (flush), чтобы
+        получить их id.
+        """
+        leads_data: Dict[str, LeadCreate] = {}
+        for lead_in in leads_in:
+            known = leads_data.get(lead_in.external_id)
+            if known is not None:
+                lead_in = LeadCreate(
+                    external_id=lead_in.external_id,
+                    email=lead_in.email or known.email,
+                    phone=lead_in.phone or known.phone)
+            leads_data[lead_in.external_id] = lead_in
+
+        keys_by_external_id = {
+            external_id: identity_keys(
+                external_id, lead_in.email, lead_in.phone)
+            for external_id, lead_in in leads_data.items()
+        }
+        all_keys = list({
+            key for keys in keys_by_external_id.values() for key in keys})
+        matches: Dict[IdentityKey, Lead] = {}
+        for i in range(0, len(all_keys), chunk_size):
+            matches.update(self.match_identities(
+                db, keys=all_keys[i:i + chunk_size]))
+        known_keys = set(matches)
+
+        leads: Dict[str, Lead] = {}
+        for external_id, lead_in in leads_data.items():
+            keys = keys_by_external_id[external_id]
+            lead = next(
+                (matches[key] for key in keys if key in matches), None)
+            if lead is None:
+                lead = Lead(**jsonable_encoder(lead_in))
+                db.add(lead)
+            else:
+                if lead_in.email:
+                    lead.email = lead_in.email
+                if lead_in.phone:
+                    lead.phone = lead_in.phone
+            leads[external_id] = lead
+            for key in keys:
+                matches.setdefault(key, lead)
+        db.flush()
+        self.add_identities(db, identities=[
+            (lead.id, kind, value)
+            for (kind, value), lead in matches.items()
+            if (kind, value) not in known_keys
+        ])
+        return leads
+
+    def get_unindexed(
+        self, db: Session, *, after_id: int = 0, limit: int = 1000
+    ) -> List[Lead]:
+        """
+        Лиды с телефоном или email, для которых еще нет идентификатора
+        этого вида: не проиндексированные или дубли другого лида.
+        Ненормализуемые значения помечаются идентификатором invalid:<id>.
+        """
+        def has_identity(kind: str):
+            return select(LeadIdentity.id).where(
+                LeadIdentity.lead_id == Lead.id,
+                LeadIdentity.kind == kind
+            ).exists()
+
+        return db.query(Lead).filter(
+            Lead.id > after_id,
+            or_(
+                and_(Lead.phone.isnot(None), ~has_identity('phone')),
+                and_(Lead.email.isnot(None), ~has_identity('email')),
+            )
+        ).order_by(Lead.id).limit(limit).all()
+
+    def merge(
+        self, db: Session, *, survivor_id: int, duplicate_id: int
+    ) -> List[IdentityKey]:
+        """
+        Склеить лида duplicate_id с survivor_id: перенести обращения
+        (включая архивные), идентификаторы и счетчик, дополнить
+        контактные данные и удалить дубль. Изменения не коммитятся.
+        Возвращает перенесенные идентификаторы: после коммита их нужно
+        сбросить из кэша через invalidate().
+        """
+        moved = db.query(LeadIdentity.kind, LeadIdentity.value).filter(
+            LeadIdentity.lead_id == duplicate_id).all()
+        survivor = db.get(Lead, survivor_id, with_for_update=True)
+        duplicate = db.get(Lead, duplicate_id, with_for_update=True)
+        for model in (Contact, ContactArchive):
+            db.query(model).filter(model.lead_id == duplicate_id).update(
+                {model.lead_id: survivor_id}, synchronize_session=False)
+        db.query(LeadIdentity).filter(
+            LeadIdentity.lead_id == duplicate_id
+        ).update({LeadIdentity.lead_id: survivor_id},
+                 synchronize_session=False)
+        survivor.contact_count += duplicate.contact_count
+        survivor.email = survivor.email or duplicate.email
+        survivor.phone = survivor.phone or duplicate.phone
+        db.expunge(duplicate)
+        db.query(Lead).filter(Lead.id == duplicate_id).delete(
+            synchronize_session=False)
+        db.flush()
+        return [(kind, value) for kind, value in moved]
+
     def get_with_contact_count(
         self, db: Session, *, lead_id: int
     ) -> Optional[Lead]:
-        lead = self.get(db, id=lead_id)
-        if lead:
-            contact_count = db.query(func.count(Contact.id)).filter(
-                Contact.lead_id == lead_id
-            ).scalar()
-            setattr(lead, 'contact_count', contact_count)
-        return lead
+        return self.get(db, id=lead_id)
 
     def get_multi_with_contact_count(
-        self, db: Session, *, skip: int = 0, limit: int = 100
+        self, db: Session, *, skip: int = 0, limit: int = 100,
+        after_id: Optional[int] = None
     ) -> List[Lead]:
-        leads = self.get_multi(db, skip=skip, limit=limit)
-        for lead in leads:
-            contact_count = db.query(func.count(Contact.id)).filter(
-                Contact.lead_id == lead.id
-            ).scalar()
-            setattr(lead, 'contact_count', contact_count)
-        return leads
+        return self.get_multi(db, skip=skip, limit=limit, after_id=after_id)
+
+    def increment_contact_counts(
+        self, db: Session, *, counts: Dict[int, int]
+    ) -> None:
+        """
+        Увеличить contact_count лидов на counts[lead_id] в текущей
+        транзакции, не коммитя ее.
+        """
+        if not counts:
+            return
+        db.connection().execute(
+            update(Lead)
+            .where(Lead.id == bindparam('lead_id'))
+            .values(contact_count=Lead.contact_count + bindparam('delta')),
+            [
+                {'lead_id': lead_id, 'delta': delta}
+                for lead_id, delta in counts.items()
+            ]
+        )
 
+    def repair_contact_counts(self, db: Session) -> int:
+        """
+        Пересчитать contact_count по обращениям (включая архивные) там,
+        где он разошелся. Возвращает число исправленных лидов.
+        """
+        actual = sum(
+            select(func.count(model.id))
+            .where(model.lead_id == Lead.id)
+            .scalar_subquery()
+            for model in (Contact, ContactArchive)
+        )
+        repaired = db.execute(
+            update(Lead)
+            .where(Lead.contact_count != actual)
+            .values(contact_count=actual)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        return repaired
 
-lead = CRUDLead(Lead)
+lead = CRUDLead(
+    Lead, TTLCache(settings.LEAD_CACHE_SIZE, settings.LEAD_CACHE_TTL))
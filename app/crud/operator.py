@@ -1,13 +1,16 @@
+import logging
 from typing import List, Optional
 
-from sqlalchemy import func
+from sqlalchemy import case, func, select, update
 from sqlalchemy.orm import Session
 
-from app.crud.base import CRUDBase
+from app.crud.base import AsyncCRUDBase, CRUDBase, paginate
 from app.models.contact import Contact
 from app.models.operator import Operator
 from app.schemas.operator import OperatorCreate, OperatorUpdate
 
+logger = logging.getLogger(__name__)
+
 
 class CRUDOperator(CRUDBase[Operator, OperatorCreate, OperatorUpdate]):
     def get_by_name(self, db: Session, *, name: str) -> Optional[Operator]:
@@ -19,27 +22,145 @@ class CRUDOperator(CRUDBase[Operator, OperatorCreate, OperatorUpdate]):
     def get_with_load(
         self, db: Session, *, operator_id: int
     ) -> Optional[Operator]:
-        operator = self.get(db, id=operator_id)
-        if operator:
-            current_load = db.query(func.count(Contact.id)).filter(
-                Contact.operator_id == operator.id,
-                Contact.is_active == True
-            ).scalar()
-            setattr(operator, 'current_load', current_load)
+        row = db.query(Operator, self._current_load()).filter(
+            Operator.id == operator_id).first()
+        if row is None:
+            return None
+        operator, current_load = row
+        setattr(operator, 'current_load', current_load)
         return operator
 
     def get_multi_with_load(
-        self, db: Session, *, skip: int = 0, limit: int = 100
+        self, db: Session, *, skip: int = 0, limit: int = 100,
+        after_id: Optional[int] = None, only_available: bool = False
     ) -> List[Operator]:
-        operators = self.get_multi(db, skip=skip, limit=limit)
-        for operator in operators:
-            current_load = db.query(func.count(Contact.id)).filter(
-                Contact.operator_id == operator.id,
-                Contact.is_active == True
-            ).scalar()
-            setattr(operator, 'current_load', current_load)
+        """
+        Страница операторов с current_load одним запросом. С only_available
+        - только активные операторы, у которых current_load < max_load.
+        """
+        current_load = self._current_load()
+        query = db.query(Operator, current_load)
+        if only_available:
+            query = query.filter(
+                Operator.is_active == True,
+                current_load < Operator.max_load
+            )
+        operators = []
+        for operator, load in paginate(
+            query, Operator.id, skip=skip, limit=limit, after_id=after_id
+        ):
+            setattr(operator, 'current_load', load)
+            operators.append(operator)
         return operators
 
+    @staticmethod
+    def _current_load():
+        """
+        Нагрузка оператора - число открытых обращений, как при
+        распределении: коррелированный подзапрос по покрывающему индексу
+        (operator_id, is_active, status), поэтому стоимость зависит от
+        нагрузки операторов страницы, а не от размера таблицы.
+        """
+        return select(func.count(Contact.id)).where(
+            Contact.operator_id == Operator.id,
+            Contact.is_open
+        ).correlate(Operator).scalar_subquery()
+
+    def reserve_slots(
+        self, db: Session, *, operator_id: int, count: int = 1,
+        max_attempts: int = 5
+    ) -> int:
+        """
+        Атомарно зарезервировать до count слотов оператора.
+
+        Счетчик cached_load увеличивается условным UPDATE, который
+        срабатывает только при наличии свободных слотов, поэтому
+        параллельные запросы не превышают max_load. Резерв не
+        коммитится и откатывается вместе с транзакцией.
+        Возвращает число зарезервированных слотов.
+        """
+        reserved = db.query(Operator).filter(
+            Operator.id == operator_id,
+            Operator.is_active == True,
+            Operator.cached_load + count <= Operator.max_load
+        ).update(
+            {Operator.cached_load: Operator.cached_load + count},
+            synchronize_session=False
+        )
+        if reserved or count == 1:
+            return count if reserved else 0
+
+        # Частичное резервирование: сравнение с прочитанным значением
+        # и повтор при конфликте
+        for _ in range(max_attempts):
+            row = db.query(
+                Operator.cached_load, Operator.max_load
+            ).filter(
+                Operator.id == operator_id,
+                Operator.is_active == True
+            ).first()
+            if row is None:
+                return 0
+            available = min(count, row.max_load - row.cached_load)
+            if available <= 0:
+                return 0
+            reserved = db.query(Operator).filter(
+                Operator.id == operator_id,
+                Operator.cached_load == row.cached_load
+            ).update(
+                {Operator.cached_load: Operator.cached_load + available},
+                synchronize_session=False
+            )
+            if reserved:
+                return available
+        return 0
+
+    def adjust_cached_load(
+        self, db: Session, *, operator_id: int, delta: int
+    ) -> None:
+        """Изменить счетчик cached_load без коммита."""
+        if not operator_id or not delta:
+            return
+        new_load = Operator.cached_load + delta
+        db.query(Operator).filter(Operator.id == operator_id).update(
+            {Operator.cached_load: case((new_load < 0, 0), else_=new_load)},
+            synchronize_session=False
+        )
+
+    def reconcile_cached_load(self, db: Session) -> int:
+        """
+        Пересчитать cached_load по открытым обращениям там, где он
+        разошелся с ними, и закоммитить. Возвращает число исправленных
+        операторов.
+
+        Счетчик и число обращений читаются одним запросом, а записывается
+        он условным UPDATE только если не изменился с момента чтения:
+        параллельное резервирование или закрытие меняет и то, и другое,
+        и прочитанное число для такой строки уже неверно. Пропущенные
+        строки исправит следующий запуск.
+        """
+        drifted = db.execute(
+            select(
+                Operator.id, Operator.cached_load,
+                self._current_load().label('actual')
+            ).where(Operator.cached_load != self._current_load())
+        ).all()
+        repaired = 0
+        for row in drifted:
+            repaired += db.execute(
+                update(Operator)
+                .where(
+                    Operator.id == row.id,
+                    Operator.cached_load == row.cached_load
+                )
+                .values(cached_load=row.actual)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+        db.commit()
+        if repaired:
+            logger.warning('Operator cached_load drift fixed for %s', repaired)
+        return repaired
+
     def update_load(
         self, db: Session, *, db_obj: Operator, load_change: int
     ) -> Operator:
@@ -49,3 +170,4 @@ class CRUDOperator(CRUDBase[Operator, OperatorCreate, OperatorUpdate]):
 
 
 operator = CRUDOperator(Operator)
+async_operator = AsyncCRUDBase(Operator)
@@ -2,7 +2,7 @@ from typing import Optional
 
 from sqlalchemy.orm import Session
 
-from app.crud.base import CRUDBase
+from app.crud.base import AsyncCRUDBase, CRUDBase
 from app.models.source import Source
 from app.schemas.source import SourceCreate, SourceUpdate
 
@@ -18,3 +18,4 @@ class CRUDSource(CRUDBase[Source, SourceCreate, SourceUpdate]):
 
 
 source = CRUDSource(Source)
+async_source = AsyncCRUDBase(Source)
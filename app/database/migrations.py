@@ -0,0 +1,195 @@
+import logging
+from typing import Callable, List, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateTable
+
+logger = logging.getLogger(__name__)
+
+Migration = Callable[[Connection], None]
+
+MIGRATIONS: List[Tuple[str, Migration]] = []
+
+
+def migration(name: str) -> Callable[[Migration], Migration]:
+    """
+    Зарегистрировать шаг миграции. Шаги применяются один раз в порядке
+    объявления и должны быть идемпотентны: на новой БД таблицы уже
+    созданы через create_all.
+    """
+    def decorator(func: Migration) -> Migration:
+        MIGRATIONS.append((name, func))
+        return func
+    return decorator
+
+
+def _has_column(conn: Connection, table: str, column: str) -> bool:
+    return any(
+        col['name'] == column for col in inspect(conn).get_columns(table))
+
+
+def run_migrations(engine: Engine) -> List[str]:
+    """Применить недостающие шаги миграций, вернуть их имена."""
+    with engine.begin() as conn:
+        conn.execute(text(
+            'CREATE TABLE IF NOT EXISTS schema_migrations ('
+            'name VARCHAR PRIMARY KEY, '
+            'applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)'
+        ))
+        applied = set(conn.execute(
+            text('SELECT name FROM schema_migrations')).scalars())
+
+    newly_applied = []
+    for name, func in MIGRATIONS:
+        if name in applied:
+            continue
+        with engine.begin() as conn:
+            func(conn)
+            conn.execute(
+                text('INSERT INTO schema_migrations (name) VALUES (:name)'),
+                {'name': name}
+            )
+        logger.info('Applied migration %s', name)
+        newly_applied.append(name)
+    return newly_applied
+
+
+@migration('0001_operator_cached_load')
+def add_operator_cached_load(conn: Connection) -> None:
+    if not _has_column(conn, 'operators', 'cached_load'):
+        conn.execute(text(
+            'ALTER TABLE operators '
+            'ADD COLUMN cached_load INTEGER NOT NULL DEFAULT 0'
+        ))
+    conn.execute(text(
+        'UPDATE operators SET cached_load = ('
+        'SELECT COUNT(contacts.id) FROM contacts '
+        'WHERE contacts.operator_id = operators.id '
+        'AND contacts.is_active = true '
+        "AND contacts.status IN ('new', 'in_progress', 'pending'))"
+    ))
+
+
+def _create_index(conn: Connection, table_name: str, index_name: str) -> None:
+    """Создать индекс модели, если его еще нет в БД."""
+    from app.database.session import Base
+
+    table = Base.metadata.tables[table_name]
+    index = next(index for index in table.indexes if index.name == index_name)
+    index.create(conn, checkfirst=True)
+
+
+@migration('0002_contacts_unassigned_index')
+def add_contacts_unassigned_index(conn: Connection) -> None:
+    _create_index(conn, 'contacts', 'ix_contacts_unassigned')
+
+
+@migration('0003_access_path_indexes')
+def add_access_path_indexes(conn: Connection) -> None:
+    # Уникальный индекс не создастся при повторах: оставляем последний вес
+    conn.execute(text(
+        'DELETE FROM source_operator_weights WHERE id NOT IN ('
+        'SELECT MAX(id) FROM source_operator_weights '
+        'GROUP BY source_id, operator_id)'
+    ))
+    _create_index(
+        conn, 'source_operator_weights',
+        'ix_source_operator_weights_source_operator')
+    if conn.dialect.name == 'sqlite':
+        # Старый предикат is_active не распознавался планировщиком SQLite
+        conn.execute(text('DROP INDEX IF EXISTS ix_contacts_unassigned'))
+    for index_name in (
+        'ix_contacts_unassigned',
+        'ix_contacts_operator_load',
+        'ix_contacts_source_id_id',
+        'ix_contacts_operator_id_id',
+        'ix_contacts_lead_id_id',
+        'ix_contacts_created_at',
+    ):
+        _create_index(conn, 'contacts', index_name)
+
+
+@migration('0004_lead_contact_count')
+def add_lead_contact_count(conn: Connection) -> None:
+    if not _has_column(conn, 'leads', 'contact_count'):
+        conn.execute(text(
+            'ALTER TABLE leads '
+            'ADD COLUMN contact_count INTEGER NOT NULL DEFAULT 0'
+        ))
+    conn.execute(text(
+        'UPDATE leads SET contact_count = ('
+        'SELECT COUNT(contacts.id) FROM contacts '
+        'WHERE contacts.lead_id = leads.id) + ('
+        'SELECT COUNT(contacts_archive.id) FROM contacts_archive '
+        'WHERE contacts_archive.lead_id = leads.id)'
+    ))
+
+
+@migration('0005_lead_identities')
+def add_lead_identities(conn: Connection) -> None:
+    # Телефоны и email нормализуются в Python фоновой склейкой дублей,
+    # здесь индексируются только external_id
+    conn.execute(text(
+        'INSERT INTO lead_identities (lead_id, kind, value) '
+        "SELECT leads.id, 'external_id', leads.external_id FROM leads "
+        'WHERE NOT EXISTS (SELECT 1 FROM lead_identities '
+        "WHERE lead_identities.kind = 'external_id' "
+        'AND lead_identities.value = leads.external_id)'
+    ))
+
+
+@migration('0006_contact_closed_at')
+def add_contact_closed_at(conn: Connection) -> None:
+    for table in ('contacts', 'contacts_archive'):
+        if not _has_column(conn, table, 'closed_at'):
+            conn.execute(text(
+                f'ALTER TABLE {table} ADD COLUMN closed_at TIMESTAMP'))
+    # Время закрытия старых обращений неизвестно: отсчет срока архивации
+    # начинается с применения миграции
+    conn.execute(text(
+        'UPDATE contacts SET closed_at = CURRENT_TIMESTAMP '
+        'WHERE is_active = false AND closed_at IS NULL'
+    ))
+    _create_index(conn, 'contacts', 'ix_contacts_closed_at')
+
+
+@migration('0007_contacts_autoincrement')
+def add_contacts_autoincrement(conn: Connection) -> None:
+    # В PostgreSQL id выдает последовательность и не повторяется
+    if conn.dialect.name != 'sqlite':
+        return
+    from app.database.session import Base
+
+    table = Base.metadata.tables['contacts']
+    ddl = conn.execute(text(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' "
+        "AND name = 'contacts'")).scalar()
+    if 'AUTOINCREMENT' not in ddl.upper():
+        # SQLite не меняет PRIMARY KEY через ALTER: пересоздаем таблицу
+        columns = ', '.join(column.name for column in table.columns)
+        conn.execute(text(str(
+            CreateTable(table).compile(dialect=conn.dialect)
+        ).replace('CREATE TABLE contacts', 'CREATE TABLE contacts_new', 1)))
+        conn.execute(text(
+            f'INSERT INTO contacts_new ({columns}) '
+            f'SELECT {columns} FROM contacts'))
+        conn.execute(text('DROP TABLE contacts'))
+        conn.execute(text('ALTER TABLE contacts_new RENAME TO contacts'))
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+    # id, уже выданные повторно, конфликтуют с архивом: такие обращения
+    # получают новые id, счетчик продолжается после всех выданных id
+    last_id = conn.execute(text(
+        'SELECT MAX(id) FROM (SELECT MAX(id) AS id FROM contacts '
+        'UNION ALL SELECT MAX(id) FROM contacts_archive)')).scalar() or 0
+    conn.execute(text(
+        'UPDATE contacts SET id = id + :last_id '
+        'WHERE id IN (SELECT id FROM contacts_archive)'
+    ), {'last_id': last_id})
+    conn.execute(text("DELETE FROM sqlite_sequence WHERE name = 'contacts'"))
+    conn.execute(text(
+        "INSERT INTO sqlite_sequence (name, seq) SELECT 'contacts', "
+        'MAX(:last_id, COALESCE(MAX(id), 0)) FROM contacts'
+    ), {'last_id': last_id})
@@ -1,12 +1,82 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, make_url
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import InvalidRequestError, NoSuchModuleError
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine, async_sessionmaker, create_async_engine)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 from app.core.config import settings
 
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'sqlite+pysqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'postgresql+psycopg2': 'postgresql+asyncpg',
+}
+
+
+def get_async_database_url() -> str:
+    """URL асинхронного движка: явный или DATABASE_URL с async-драйвером."""
+    if settings.ASYNC_DATABASE_URL:
+        return settings.ASYNC_DATABASE_URL
+    scheme, _, rest = settings.DATABASE_URL.partition('://')
+    return f'{ASYNC_DRIVERS.get(scheme, scheme)}://{rest}'
+
+
+def create_async_database_engine() -> AsyncEngine:
+    """
+    Асинхронный движок; если для DATABASE_URL нет async-драйвера,
+    ошибка подсказывает задать ASYNC_DATABASE_URL.
+    """
+    url = get_async_database_url()
+    try:
+        return create_async_engine(url)
+    except (ImportError, InvalidRequestError, NoSuchModuleError) as error:
+        raise RuntimeError(
+            f'Cannot create async engine for {make_url(url)!r}: {error}. '
+            'Install the async driver or set ASYNC_DATABASE_URL to a URL '
+            'with an async driver (sqlite+aiosqlite, postgresql+asyncpg)'
+        ) from error
+
+
+def configure_sqlite(engine: Engine) -> None:
+    """
+    Для SQLite: WAL, ожидание блокировки busy_timeout и транзакции
+    BEGIN IMMEDIATE. Отложенная транзакция, которая сначала читает, а
+    потом пишет, при параллельной записи сразу получает 'database is
+    locked' без ожидания; IMMEDIATE берет блокировку записи в начале и
+    ждет ее. Только читающие сессии открываются через READ_ONLY.
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        # Транзакции открывает обработчик begin, а не драйвер
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute(f'PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT}')
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def on_begin(conn):
+        mode = conn.get_execution_options().get('sqlite_begin', 'IMMEDIATE')
+        conn.exec_driver_sql(f'BEGIN {mode}')
+
+
+# Опции движка для сессий, которые только читают (длинные выгрузки):
+# в SQLite они не держат блокировку записи
+READ_ONLY = {'sqlite_begin': 'DEFERRED'}
 
 engine = create_engine(settings.DATABASE_URL)
+configure_sqlite(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+async_engine = create_async_database_engine()
+configure_sqlite(async_engine.sync_engine)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 
@@ -18,5 +88,13 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 def init_db():
+    from app.database.migrations import run_migrations
+
     Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
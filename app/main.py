@@ -1,9 +1,19 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy.orm import Session
 
 from app.api.router import api_router
 from app.core.config import settings
-from app.database.session import init_db
+from app.core.pagination import NEXT_CURSOR_HEADER
+from app.crud.operator import operator as operator_crud
+from app.database.session import SessionLocal, async_engine, init_db
+from app.services.archive import archive_job
+from app.services.distribution import distribution_service
+from app.services.idempotency import idempotency_cleanup_job
+from app.services.jobs import PeriodicJob, run_in_session
+from app.services.lead_matching import lead_dedup_job
+from app.services.load_registry import load_registry
+from app.services.redistribution import redistribution_worker
 
 
 init_db()
@@ -22,6 +32,54 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=['*'],
     allow_headers=['*'],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 app.include_router(api_router, prefix=settings.API_V1_STR)
+
+
+def reconcile_load(db: Session) -> None:
+    """Сверить с обращениями реестр нагрузки и operators.cached_load."""
+    load_registry.reconcile(db)
+    operator_crud.reconcile_cached_load(db)
+
+
+load_reconcile_job = PeriodicJob(
+    'load-reconcile',
+    settings.LOAD_RECONCILE_INTERVAL,
+    run_in_session(reconcile_load),
+)
+distribution_state_job = PeriodicJob(
+    'distribution-state-flush',
+    settings.DISTRIBUTION_STATE_FLUSH_INTERVAL,
+    run_in_session(distribution_service.persist_state),
+)
+
+
+@app.on_event('startup')
+def startup():
+    db = SessionLocal()
+    try:
+        load_registry.load(db)
+    finally:
+        db.close()
+    load_reconcile_job.start()
+    distribution_state_job.start()
+    redistribution_worker.start()
+    redistribution_worker.trigger()
+    idempotency_cleanup_job.start()
+    archive_job.start()
+    lead_dedup_job.start()
+    lead_dedup_job.trigger()
+
+
+@app.on_event('shutdown')
+async def shutdown():
+    load_reconcile_job.stop()
+    distribution_state_job.stop()
+    redistribution_worker.stop()
+    idempotency_cleanup_job.stop()
+    archive_job.stop()
+    lead_dedup_job.stop()
+    run_in_session(distribution_service.persist_state)()
+    await async_engine.dispose()
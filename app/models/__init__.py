@@ -1,6 +1,8 @@
 from app.database.session import Base
-from app.models.contact import Contact
-from app.models.lead import Lead
+from app.models.contact import Contact, ContactArchive
+from app.models.distribution import DistributionCursor
+from app.models.idempotency import IdempotencyKey
+from app.models.lead import Lead, LeadIdentity
 from app.models.operator import Operator
 from app.models.source import Source, SourceOperatorWeight
 
@@ -8,8 +10,12 @@ from app.models.source import Source, SourceOperatorWeight
 __all__ = [
     'Base',
     'Lead',
+    'LeadIdentity',
     'Operator',
     'Source',
     'Contact',
+    'ContactArchive',
     'SourceOperatorWeight',
+    'DistributionCursor',
+    'IdempotencyKey',
 ]
@@ -1,12 +1,44 @@
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String
+from sqlalchemy import (
+    Boolean, Column, DateTime, ForeignKey, Index, Integer, String, and_,
+    text)
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
 from app.database.session import Base
 
 
+# Статусы, при которых обращение занимает слот оператора
+OPEN_STATUSES = ('new', 'in_progress', 'pending')
+
+
 class Contact(Base):
     __tablename__ = 'contacts'
+    __table_args__ = (
+        # Очередь обращений, ожидающих оператора
+        Index(
+            'ix_contacts_unassigned', 'created_at', 'id',
+            # В SQLite предикат должен совпадать с условием запроса
+            sqlite_where=text('operator_id IS NULL AND is_active = 1'),
+            postgresql_where=text('operator_id IS NULL AND is_active'),
+        ),
+        # Нагрузка операторов: operator_id + открытые статусы, покрывающий
+        Index(
+            'ix_contacts_operator_load', 'operator_id', 'is_active', 'status',
+            sqlite_where=text('operator_id IS NOT NULL'),
+            postgresql_where=text('operator_id IS NOT NULL'),
+        ),
+        # Списки по источнику и оператору и история лида в порядке id
+        Index('ix_contacts_source_id_id', 'source_id', 'id'),
+        Index('ix_contacts_operator_id_id', 'operator_id', 'id'),
+        Index('ix_contacts_lead_id_id', 'lead_id', 'id'),
+        Index('ix_contacts_created_at', 'created_at'),
+        # Кандидаты в архив: закрытые обращения по времени закрытия
+        Index('ix_contacts_closed_at', 'closed_at'),
+        # id переносится в contacts_archive, поэтому SQLite не должен
+        # выдавать id удаленных (архивированных) строк повторно
+        {'sqlite_autoincrement': True},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     lead_id = Column(Integer, ForeignKey('leads.id'), nullable=False)
@@ -16,7 +48,46 @@ class Contact(Base):
     message = Column(String)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Время последнего закрытия (is_active=False), NULL у открытых
+    closed_at = Column(DateTime(timezone=True))
 
     lead = relationship('Lead', back_populates='contacts')
     source = relationship('Source', back_populates='contacts')
     operator = relationship('Operator', back_populates='contacts')
+
+    @hybrid_property
+    def is_open(self) -> bool:
+        """Учитывается ли обращение в текущей нагрузке оператора."""
+        return bool(self.is_active) and (
+            self.status or 'new') in OPEN_STATUSES
+
+    @is_open.expression
+    def is_open(cls):
+        return and_(cls.is_active == True, cls.status.in_(OPEN_STATUSES))
+
+
+class ContactArchive(Base):
+    """
+    Закрытые обращения, перенесенные из contacts фоновой архивацией.
+    id сохраняется прежним.
+    """
+
+    __tablename__ = 'contacts_archive'
+    __table_args__ = (
+        Index('ix_contacts_archive_lead_id_id', 'lead_id', 'id'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    lead_id = Column(Integer, ForeignKey('leads.id'), nullable=False)
+    source_id = Column(Integer, ForeignKey('sources.id'), nullable=False)
+    status = Column(String)
+    operator_id = Column(Integer, ForeignKey('operators.id'))
+    message = Column(String)
+    is_active = Column(Boolean, default=False)
+    created_at = Column(DateTime(timezone=True))
+    closed_at = Column(DateTime(timezone=True))
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    lead = relationship('Lead', viewonly=True)
+    source = relationship('Source', viewonly=True)
+    operator = relationship('Operator', viewonly=True)
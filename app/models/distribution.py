@@ -0,0 +1,18 @@
+from sqlalchemy import Column, DateTime, ForeignKey, Integer
+from sqlalchemy.sql import func
+
+from app.database.session import Base
+
+
+class DistributionCursor(Base):
+    """Позиция round-robin курсора по источнику."""
+
+    __tablename__ = 'distribution_cursors'
+
+    source_id = Column(Integer, ForeignKey('sources.id'), primary_key=True)
+    last_operator_id = Column(Integer, nullable=False)
+    updated_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now()
+    )
@@ -0,0 +1,17 @@
+from sqlalchemy import JSON, Column, DateTime, Integer, String
+from sqlalchemy.sql import func
+
+from app.database.session import Base
+
+
+class IdempotencyKey(Base):
+    """Сохраненный ответ на запрос с заголовком Idempotency-Key."""
+
+    __tablename__ = 'idempotency_keys'
+
+    key = Column(String, primary_key=True)
+    request_hash = Column(String, nullable=False)
+    status_code = Column(Integer, nullable=False)
+    response = Column(JSON, nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
+    expires_at = Column(DateTime, nullable=False, index=True)
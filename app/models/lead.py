@@ -1,4 +1,4 @@
-from sqlalchemy import Column, DateTime, Integer, String
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, String
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -13,5 +13,28 @@ class Lead(Base):
     email = Column(String, index=True)
     phone = Column(String, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Число обращений лида, включая архивные; ведется при создании
+    # обращений, сверяется командой scripts/repair_lead_counts.py
+    contact_count = Column(
+        Integer, nullable=False, default=0, server_default='0')
 
     contacts = relationship('Contact', back_populates='lead')
+
+
+class LeadIdentity(Base):
+    """
+    Нормализованный идентификатор лида: external_id из любого источника,
+    телефон в E.164 или email в нижнем регистре. По ним находится лид,
+    пришедший из разных источников.
+    """
+
+    __tablename__ = 'lead_identities'
+    __table_args__ = (
+        Index('ix_lead_identities_kind_value', 'kind', 'value', unique=True),
+        Index('ix_lead_identities_lead_id_kind', 'lead_id', 'kind'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    lead_id = Column(Integer, ForeignKey('leads.id'), nullable=False)
+    kind = Column(String, nullable=False)
+    value = Column(String, nullable=False)
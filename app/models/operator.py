@@ -11,6 +11,9 @@ class Operator(Base):
     name = Column(String, nullable=False)
     is_active = Column(Boolean, default=True)
     max_load = Column(Integer, default=10)
+    # Счетчик открытых обращений для атомарного резервирования слотов
+    cached_load = Column(
+        Integer, nullable=False, default=0, server_default='0')
 
     source_weights = relationship(
         'SourceOperatorWeight', back_populates='operator')
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, ForeignKey, Integer, String
+from sqlalchemy import Column, ForeignKey, Index, Integer, String
 from sqlalchemy.orm import relationship
 
 from app.database.session import Base
@@ -21,6 +21,12 @@ class Source(Base):
 
 class SourceOperatorWeight(Base):
     __tablename__ = 'source_operator_weights'
+    __table_args__ = (
+        Index(
+            'ix_source_operator_weights_source_operator',
+            'source_id', 'operator_id', unique=True,
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     source_id = Column(Integer, ForeignKey('sources.id'))
@@ -1,4 +1,6 @@
-from .contact import Contact, ContactCreate, ContactStatusUpdate, ContactUpdate
+from .contact import (
+    Contact, ContactAssignment, ContactBatchResult, ContactCreate,
+    ContactStatusUpdate, ContactUpdate)
 from .distribution import DistributionConfig, DistributionResult
 from .lead import Lead, LeadCreate, LeadUpdate
 from .operator import (
@@ -17,6 +19,7 @@ __all__ = [
     'Source', 'SourceCreate', 'SourceUpdate', 'SourceOperatorWeight',
     'SourceOperatorWeightCreate',
     'Contact', 'ContactCreate', 'ContactUpdate', 'ContactStatusUpdate',
+    'ContactAssignment', 'ContactBatchResult',
     'ContactWithDetails', 'LeadWithContacts', 'SourceWithWeights',
     'DistributionStats', 'OperatorStats', 'SourceStats',
     'DistributionResult', 'DistributionConfig',
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 from pydantic import BaseModel, EmailStr
 
@@ -34,3 +34,17 @@ class Contact(ContactBase):
 
 class ContactStatusUpdate(BaseModel):
     is_active: bool
+
+
+class ContactAssignment(BaseModel):
+    id: int
+    lead_id: int
+    source_id: int
+    operator_id: Optional[int]
+
+
+class ContactBatchResult(BaseModel):
+    total: int
+    assigned: int
+    unassigned: int
+    contacts: List[ContactAssignment] = []
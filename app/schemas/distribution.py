@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 from pydantic import BaseModel
 
@@ -10,6 +10,8 @@ class DistributionResult(BaseModel):
     operator: Optional[Operator] = None
     alternatives: List[Operator] = []
     error: Optional[str] = None
+    strategy: Optional[str] = None
+    details: Dict[str, Any] = {}
 
 
 class DistributionConfig(BaseModel):
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import List, Optional
+from typing import Any, List, Optional
 
 from pydantic import BaseModel, EmailStr
 
@@ -23,6 +23,31 @@ class ContactWithDetails(BaseModel):
     source: Source
     operator: Optional[Operator] = None
 
+    @classmethod
+    def from_contact(
+        cls, contact: Any, lead: Any = None
+    ) -> 'ContactWithDetails':
+        """
+        Собрать ответ из обращения с загруженными связями lead, source и
+        operator. lead можно передать явно, например с contact_count.
+        """
+        lead = lead or contact.lead
+        return cls(
+            id=contact.id,
+            lead_external_id=lead.external_id,
+            source_id=contact.source_id,
+            message=contact.message,
+            lead_email=lead.email,
+            lead_phone=lead.phone,
+            lead_id=contact.lead_id,
+            operator_id=contact.operator_id,
+            is_active=contact.is_active,
+            created_at=contact.created_at,
+            lead=lead,
+            source=contact.source,
+            operator=contact.operator
+        )
+
 
 class LeadWithContacts(BaseModel):
     id: int
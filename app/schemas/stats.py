@@ -22,3 +22,11 @@ class DistributionStats(BaseModel):
     by_operator: List[OperatorStats]
     by_source: List[SourceStats]
     summary: Dict[str, int]
+
+
+class CacheStats(BaseModel):
+    size: int
+    maxsize: int
+    hits: int
+    misses: int
+    hit_rate: float
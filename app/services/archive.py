@@ -0,0 +1,70 @@
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.contact import Contact, ContactArchive
+from app.services.jobs import PeriodicJob, run_in_session
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_COLUMNS = (
+    'id', 'lead_id', 'source_id', 'status', 'operator_id', 'message',
+    'is_active', 'created_at', 'closed_at',
+)
+
+
+def archive_contacts(
+    db: Session,
+    older_than_days: int = settings.ARCHIVE_AFTER_DAYS,
+    batch_size: int = settings.ARCHIVE_BATCH_SIZE
+) -> int:
+    """
+    Перенести обращения, закрытые (is_active=False) больше
+    older_than_days дней назад, из contacts в contacts_archive.
+
+    Каждая пачка из batch_size строк переносится отдельной короткой
+    транзакцией: строки блокируются, копируются и удаляются из горячей
+    таблицы. Закрытые обращения не входят в нагрузку операторов, поэтому
+    счетчики нагрузки не меняются. Возвращает число перенесенных строк.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    condition = (Contact.is_active == False) & (Contact.closed_at < cutoff)
+    total = 0
+    while True:
+        ids = db.execute(
+            select(Contact.id)
+            .where(condition)
+            .order_by(Contact.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).scalars().all()
+        if not ids:
+            break
+
+        selected = condition & Contact.id.in_(ids)
+        db.execute(
+            insert(ContactArchive).from_select(
+                ARCHIVE_COLUMNS,
+                select(*(getattr(Contact, column)
+                         for column in ARCHIVE_COLUMNS)).where(selected)
+            )
+        )
+        db.execute(delete(Contact).where(selected))
+        db.commit()
+        total += len(ids)
+        if len(ids) < batch_size:
+            break
+
+    if total:
+        logger.info('Archived %s closed contacts', total)
+    return total
+
+
+archive_job = PeriodicJob(
+    'contacts-archive',
+    settings.ARCHIVE_INTERVAL,
+    run_in_session(archive_contacts),
+)
@@ -1,186 +1,594 @@
 from abc import ABC, abstractmethod
+import bisect
+import heapq
 import random
-from typing import List, Optional
-
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func
-
-from app.models import Operator, SourceOperatorWeight, Contact
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.crud.contact import contact as contact_crud
+from app.crud.operator import operator as operator_crud
+from app.models import (
+    Contact, DistributionCursor, Operator, SourceOperatorWeight)
 from app.schemas.distribution import DistributionResult
+from app.services.load_registry import OperatorLoadRegistry, load_registry
+from app.services.sampling import SamplingTableCache, SourceSamplingTable
+
+# Запись кучи LeastLoaded: ключ, -вес, id оператора, версия, нагрузка
+HeapEntry = Tuple[float, int, int, int, int]
 
 
 class DistributionStrategy(ABC):
     """Абстрактный класс стратегии распределения контактов."""
 
+    def __init__(self, registry: Optional[OperatorLoadRegistry] = None):
+        self.registry = registry or load_registry
+
     @abstractmethod
     def select_operator(
         self,
         db: Session,
         source_id: int,
-        excluded_operator_ids: Optional[List[int]] = None
+        excluded_operator_ids: Optional[List[int]] = None,
+        loads: Optional[Dict[int, int]] = None
     ) -> Optional[DistributionResult]:
+        """
+        Выбрать оператора. Если передан loads, нагрузка операторов
+        берется из этого снимка, а не из реестра.
+        """
         pass
 
-    def _get_operator_load(self, db: Session, operator_id: int) -> int:
-        """Получить текущую нагрузку оператора."""
-        return (
-            db.query(func.count(Contact.id))
-            .filter(
-                Contact.operator_id == operator_id,
-                Contact.status.in_(['new', 'in_progress', 'pending'])
-            )
-            .scalar() or 0
-        )
+    def _get_operator_load(
+        self,
+        db: Session,
+        operator_id: int,
+        loads: Optional[Dict[int, int]] = None
+    ) -> int:
+        """Получить текущую нагрузку оператора из снимка или реестра."""
+        if loads is not None:
+            return loads.get(operator_id, 0)
+        return self.registry.get(db, operator_id)
+
+    def load_snapshot(self, db: Session) -> Dict[int, int]:
+        """Снимок нагрузки всех операторов для пакетного распределения."""
+        return self.registry.snapshot(db)
+
+    def persist_state(self, db: Session) -> None:
+        """Сохранить в БД состояние стратегии, которое живет в памяти."""
+
+    def invalidate(self, source_id: Optional[int] = None) -> None:
+        """
+        Сбросить закэшированные данные стратегии после изменения весов
+        источника (или всех источников, если source_id не передан),
+        активности или лимитов операторов.
+        """
+
+    def close(self) -> None:
+        """Отписаться от реестра нагрузки, если стратегия подписана."""
 
 
 class WeightedDistributionStrategy(DistributionStrategy):
     """Стратегия распределения на основе весов операторов."""
 
+    def __init__(
+        self,
+        registry: Optional[OperatorLoadRegistry] = None,
+        load_source: Optional[str] = None
+    ):
+        super().__init__(registry)
+        self.load_source = load_source or settings.DISTRIBUTION_LOAD_SOURCE
+        self.tables = SamplingTableCache(settings.DISTRIBUTION_TABLE_TTL)
+
+    def invalidate(self, source_id: Optional[int] = None) -> None:
+        self.tables.invalidate(source_id)
+
+    def load_snapshot(self, db: Session) -> Dict[int, int]:
+        if self.load_source == 'db':
+            return contact_crud.get_open_load_by_operator(db)
+        return super().load_snapshot(db)
+
+    def get_sampling_table(
+        self, db: Session, source_id: int
+    ) -> SourceSamplingTable:
+        """Получить таблицу выбора источника, построив ее при отсутствии."""
+        table = self.tables.get(source_id)
+        if table is None:
+            rows = (
+                db.query(
+                    SourceOperatorWeight.operator_id,
+                    SourceOperatorWeight.weight,
+                    Operator.max_load
+                )
+                .join(Operator,
+                      SourceOperatorWeight.operator_id == Operator.id)
+                .filter(
+                    SourceOperatorWeight.source_id == source_id,
+                    Operator.is_active == True
+                )
+                .order_by(SourceOperatorWeight.id)
+                .all()
+            )
+            table = SourceSamplingTable(
+                operator_ids=[row.operator_id for row in rows],
+                weights=[row.weight or 0 for row in rows],
+                max_loads=[row.max_load or 0 for row in rows]
+            )
+            self.tables.set(source_id, table)
+        return table
+
     def get_available_operators(
         self,
         db: Session,
         source_id: int,
-        excluded_operator_ids: Optional[List[int]] = None
-    ) -> List[SourceOperatorWeight]:
+        excluded_operator_ids: Optional[List[int]] = None,
+        loads: Optional[Dict[int, int]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Получить операторов источника, которые могут принять обращение,
+        одним запросом к БД.
+
+        Нагрузка берется из снимка loads, из реестра нагрузки либо, при
+        load_source='db', считается в том же запросе через LEFT JOIN по
+        открытым обращениям.
+        """
         if excluded_operator_ids is None:
             excluded_operator_ids = []
 
-        query = (
-            db.query(SourceOperatorWeight)
-            .filter(SourceOperatorWeight.source_id == source_id)
-            .options(joinedload(SourceOperatorWeight.operator))
-        )
+        aggregate_load = self.load_source == 'db' and loads is None
+        if aggregate_load:
+            current_load = func.count(Contact.id)
+            query = (
+                db.query(
+                    Operator,
+                    SourceOperatorWeight.weight,
+                    current_load.label('current_load')
+                )
+                .join(SourceOperatorWeight,
+                      SourceOperatorWeight.operator_id == Operator.id)
+                .outerjoin(Contact, and_(
+                    Contact.operator_id == Operator.id, Contact.is_open))
+                .group_by(Operator.id, SourceOperatorWeight.id)
+                .having(current_load < Operator.max_load)
+            )
+        else:
+            query = (
+                db.query(Operator, SourceOperatorWeight.weight)
+                .join(SourceOperatorWeight,
+                      SourceOperatorWeight.operator_id == Operator.id)
+            )
 
+        query = query.filter(
+            SourceOperatorWeight.source_id == source_id,
+            Operator.is_active == True
+        )
         if excluded_operator_ids:
             query = query.filter(
                 SourceOperatorWeight.operator_id.notin_(excluded_operator_ids)
             )
 
-        query = (
-            query.join(Operator)
-            .filter(Operator.is_active == True)
-        )
-
-        return query.all()
+        available_operators = []
+        for row in query.order_by(SourceOperatorWeight.id):
+            operator = row.Operator
+            if aggregate_load:
+                current_load = row.current_load
+            else:
+                current_load = self._get_operator_load(
+                    db, operator.id, loads)
+            if current_load < operator.max_load:
+                available_operators.append({
+                    'operator': operator,
+                    'weight': row.weight,
+                    'current_load': current_load,
+                    'available_capacity': operator.max_load - current_load
+                })
+        return available_operators
 
     def select_operator(
         self,
         db: Session,
         source_id: int,
-        excluded_operator_ids: Optional[List[int]] = None
+        excluded_operator_ids: Optional[List[int]] = None,
+        loads: Optional[Dict[int, int]] = None
     ) -> Optional[DistributionResult]:
         """
         Выбрать оператора для распределения контакта на основе
         весов и текущей нагрузки.
         """
-        if excluded_operator_ids is None:
-            excluded_operator_ids = []
+        if self.load_source != 'db' or loads is not None:
+            return self._select_from_table(
+                db, source_id, excluded_operator_ids or [], loads)
 
-        weights = self.get_available_operators(
+        available_operators = self.get_available_operators(
             db, source_id, excluded_operator_ids)
 
-        if not weights:
-            return None
-
-        available_operators = []
-
-        for weight in weights:
-            operator = weight.operator
-            current_load = self._get_operator_load(db, operator.id)
-
-            if current_load < operator.load_limit:
-                available_operators.append({
-                    'operator': operator,
-                    'weight': weight.weight,
-                    'current_load': current_load,
-                    'available_capacity': operator.load_limit - current_load
-                })
-
         if not available_operators:
             return None
 
         # Вычисляем приоритеты на основе веса и доступной емкости
-        operators = []
-        priorities = []
-
-        for op_data in available_operators:
-            operators.append(op_data['operator'])
-            priority = op_data['weight'] * op_data['available_capacity']
-            priorities.append(priority)
+        priorities = [
+            op_data['weight'] * op_data['available_capacity']
+            for op_data in available_operators
+        ]
 
         total_priority = sum(priorities)
         if total_priority == 0:
             normalized_priorities = [1 / len(priorities)] * len(priorities)
         else:
             normalized_priorities = [p / total_priority for p in priorities]
-        selected_operator = random.choices(
-            operators,
+        selected = random.choices(
+            available_operators,
             weights=normalized_priorities,
             k=1
         )[0]
+        selected_operator = selected['operator']
 
-        operator_weight = next(
-            (w.weight for w in weights
-             if w.operator_id == selected_operator.id),
-            1
+        return DistributionResult(
+            success=True,
+            operator=selected_operator,
+            strategy=self.__class__.__name__,
+            details={
+                'weight': selected['weight'],
+                'current_load': selected['current_load'],
+                'load_limit': selected_operator.max_load
+            })
+
+    def _select_from_table(
+        self,
+        db: Session,
+        source_id: int,
+        excluded_operator_ids: List[int],
+        loads: Optional[Dict[int, int]] = None
+    ) -> Optional[DistributionResult]:
+        table = self.get_sampling_table(db, source_id)
+        if loads is None:
+            self.registry.ensure_loaded(db)
+        index = table.pick(
+            lambda operator_id: self._get_operator_load(
+                db, operator_id, loads),
+            excluded_operator_ids
         )
+        if index is None:
+            return None
+
+        selected_operator = db.get(Operator, table.operator_ids[index])
+        if selected_operator is None:
+            self.invalidate(source_id)
+            return None
 
         return DistributionResult(
+            success=True,
             operator=selected_operator,
             strategy=self.__class__.__name__,
             details={
-                'weight': operator_weight,
-                'current_load':
-                self._get_operator_load(db, selected_operator.id),
-                'load_limit': selected_operator.load_limit
+                'weight': table.weights[index],
+                'current_load': self._get_operator_load(
+                    db, selected_operator.id, loads),
+                'load_limit': selected_operator.max_load
             })
 
 
 class RoundRobinDistributionStrategy(DistributionStrategy):
+    """
+    Стратегия распределения по кругу.
+
+    Для каждого источника хранится курсор - последний назначенный
+    оператор. Следующий выбор идет по кольцу активных операторов
+    (по возрастанию id) начиная с оператора после курсора и пропускает
+    исключенных и заполненных. Кольцо кэшируется до изменения операторов
+    или весов и не дольше DISTRIBUTION_TABLE_TTL секунд, как таблицы
+    weighted-стратегии: так изменения из других процессов тоже
+    подхватываются. Курсоры живут в памяти и периодически сохраняются в
+    distribution_cursors.
+    """
+
+    def __init__(self, registry: Optional[OperatorLoadRegistry] = None):
+        super().__init__(registry)
+        self._lock = threading.Lock()
+        # Единственная запись: (id операторов кольца, их max_load)
+        self._ring: TTLCache[Tuple[List[int], Dict[int, int]]] = TTLCache(
+            1, settings.DISTRIBUTION_TABLE_TTL)
+        self._cursors: Optional[Dict[int, int]] = None
+        self._dirty: Set[int] = set()
+
+    def invalidate(self, source_id: Optional[int] = None) -> None:
+        self._ring.clear()
+
+    def _get_ring(self, db: Session) -> Tuple[List[int], Dict[int, int]]:
+        ring = self._ring.get(None)
+        if ring is None:
+            rows = (
+                db.query(Operator.id, Operator.max_load)
+                .filter(Operator.is_active == True)
+                .order_by(Operator.id)
+                .all()
+            )
+            ring = (
+                [row.id for row in rows],
+                {row.id: row.max_load or 0 for row in rows}
+            )
+            self._ring.set(None, ring)
+        return ring
+
+    def _get_cursors(self, db: Session) -> Dict[int, int]:
+        if self._cursors is None:
+            cursors = {
+                cursor.source_id: cursor.last_operator_id
+                for cursor in db.query(DistributionCursor)
+            }
+            with self._lock:
+                if self._cursors is None:
+                    self._cursors = cursors
+        return self._cursors
 
     def select_operator(
         self,
         db: Session,
         source_id: int,
-        excluded_operator_ids: Optional[List[int]] = None
+        excluded_operator_ids: Optional[List[int]] = None,
+        loads: Optional[Dict[int, int]] = None
     ) -> Optional[DistributionResult]:
-        if excluded_operator_ids is None:
-            excluded_operator_ids = []
+        excluded = set(excluded_operator_ids or [])
+        ring, max_loads = self._get_ring(db)
+        cursors = self._get_cursors(db)
+        if loads is None:
+            self.registry.ensure_loaded(db)
+
+        with self._lock:
+            start = bisect.bisect_right(ring, cursors.get(source_id, 0))
+            for step in range(len(ring)):
+                operator_id = ring[(start + step) % len(ring)]
+                if operator_id in excluded:
+                    continue
+                current_load = self._get_operator_load(
+                    db, operator_id, loads)
+                if current_load < max_loads.get(operator_id, 0):
+                    cursors[source_id] = operator_id
+                    self._dirty.add(source_id)
+                    break
+            else:
+                return None
+
+        selected_operator = db.get(Operator, operator_id)
+        if selected_operator is None:
+            self.invalidate()
+            return None
 
-        operators = (
-            db.query(Operator)
+        return DistributionResult(
+            success=True,
+            operator=selected_operator,
+            strategy=self.__class__.__name__,
+            details={
+                'current_load': current_load,
+                'load_limit': selected_operator.max_load
+            }
+        )
+
+    def persist_state(self, db: Session) -> None:
+        with self._lock:
+            if not self._dirty or self._cursors is None:
+                return
+            dirty = {
+                source_id: self._cursors[source_id]
+                for source_id in self._dirty
+            }
+            self._dirty = set()
+        try:
+            for source_id, operator_id in dirty.items():
+                db.merge(DistributionCursor(
+                    source_id=source_id, last_operator_id=operator_id))
+            db.commit()
+        except Exception:
+            # Курсоры сохранятся следующим запуском
+            db.rollback()
+            with self._lock:
+                self._dirty |= set(dirty)
+            raise
+
+
+class LeastLoadedDistributionStrategy(DistributionStrategy):
+    """
+    Стратегия выбора наименее загруженного оператора.
+
+    Для каждого источника хранится min-куча операторов по ключу
+    (нагрузка / max_load) / вес, при равном ключе первым идет оператор
+    с большим весом. Изменения нагрузки приходят из реестра и добавляют
+    в кучи источников оператора новую запись за O(log n); устаревшие
+    записи отбрасываются при извлечении по номеру версии. Заполненные
+    операторы убираются из кучи до следующего изменения их нагрузки.
+    Кучи перестраиваются после изменения весов или операторов и после
+    сверки реестра с БД.
+
+    Запросы к БД выполняются без блокировки: стратегия вызывается из
+    event loop через AsyncSession.run_sync, и ожидание блокировки на
+    время ввода-вывода остановило бы весь loop.
+    """
+
+    def __init__(self, registry: Optional[OperatorLoadRegistry] = None):
+        super().__init__(registry)
+        self._lock = threading.Lock()
+        self._heaps: Dict[int, List[HeapEntry]] = {}
+        self._weights: Dict[int, Dict[int, int]] = {}
+        self._max_loads: Dict[int, int] = {}
+        self._sources_by_operator: Dict[int, Set[int]] = {}
+        self._versions: Dict[int, int] = {}
+        self.registry.subscribe(self._on_load_change)
+
+    def invalidate(self, source_id: Optional[int] = None) -> None:
+        with self._lock:
+            if source_id is None:
+                self._heaps = {}
+                self._weights = {}
+                self._sources_by_operator = {}
+            else:
+                self._heaps.pop(source_id, None)
+                self._weights.pop(source_id, None)
+
+    def close(self) -> None:
+        self.registry.unsubscribe(self._on_load_change)
+
+    def _on_load_change(
+        self, operator_id: Optional[int], load: Optional[int]
+    ) -> None:
+        if operator_id is None:
+            self.invalidate()
+            return
+        with self._lock:
+            version = self._versions.get(operator_id, 0) + 1
+            self._versions[operator_id] = version
+            for source_id in self._sources_by_operator.get(operator_id, ()):
+                heap = self._heaps.get(source_id)
+                if heap is not None:
+                    heapq.heappush(heap, self._entry(
+                        source_id, operator_id, version, load))
+
+    def _entry(
+        self, source_id: int, operator_id: int, version: int, load: int
+    ) -> HeapEntry:
+        weight = self._weights[source_id][operator_id]
+        max_load = self._max_loads.get(operator_id, 0)
+        if weight <= 0 or max_load <= 0:
+            key = float('inf')
+        else:
+            key = load / max_load / weight
+        return key, -weight, operator_id, version, load
+
+    def _read_source(
+        self,
+        db: Session,
+        source_id: int,
+        loads: Optional[Dict[int, int]]
+    ) -> List[Tuple[int, int, int, int]]:
+        """Операторы источника: (id, вес, max_load, нагрузка)."""
+        rows = (
+            db.query(
+                SourceOperatorWeight.operator_id,
+                SourceOperatorWeight.weight,
+                Operator.max_load
+            )
+            .join(Operator, SourceOperatorWeight.operator_id == Operator.id)
             .filter(
-                Operator.is_active == True,
-                Operator.id.notin_(excluded_operator_ids)
+                SourceOperatorWeight.source_id == source_id,
+                Operator.is_active == True
             )
-            .order_by(func.coalesce(
-                db.query(func.count(Contact.id))
-                .filter(
-                    Contact.operator_id == Operator.id,
-                    Contact.status.in_(['new', 'in_progress', 'pending'])
-                )
-                .scalar_subquery(),
-                0
-            ))
             .all()
         )
+        return [
+            (row.operator_id, row.weight or 0, row.max_load or 0,
+             self._get_operator_load(db, row.operator_id, loads))
+            for row in rows
+        ]
 
-        if not operators:
-            return None
+    def _install_heap(
+        self,
+        source_id: int,
+        operators: List[Tuple[int, int, int, int]]
+    ) -> List[HeapEntry]:
+        """
+        Построить кучу источника из прочитанных данных. Вызывается под
+        блокировкой; нагрузка, изменившаяся после чтения, исправляется
+        при извлечении записи.
+        """
+        self._weights[source_id] = {
+            operator_id: weight for operator_id, weight, _, _ in operators}
+        heap = []
+        for operator_id, _, max_load, load in operators:
+            self._max_loads[operator_id] = max_load
+            self._sources_by_operator.setdefault(
+                operator_id, set()).add(source_id)
+            heap.append(self._entry(
+                source_id, operator_id,
+                self._versions.get(operator_id, 0), load))
+        heapq.heapify(heap)
+        self._heaps[source_id] = heap
+        return heap
+
+    def _needs_rebuild(self, source_id: int) -> bool:
+        heap = self._heaps.get(source_id)
+        # Слишком много устаревших записей - проще перестроить кучу
+        return heap is None or len(heap) > 4 * len(
+            self._weights.get(source_id, ())) + 64
+
+    def _pop_available(
+        self,
+        db: Session,
+        source_id: int,
+        excluded: Set[int],
+        loads: Optional[Dict[int, int]]
+    ) -> Optional[Tuple[int, int, float]]:
+        """
+        Вершина кучи источника, которая может принять обращение.
+        Вызывается под блокировкой, нагрузка берется из снимка или
+        реестра в памяти.
+        """
+        heap = self._heaps[source_id]
+        skipped = []
+        selected = None
+        while heap:
+            key, _, operator_id, version, load = heap[0]
+            if version != self._versions.get(operator_id, 0):
+                heapq.heappop(heap)
+                continue
+            current_load = self._get_operator_load(db, operator_id, loads)
+            if current_load != load:
+                heapq.heapreplace(heap, self._entry(
+                    source_id, operator_id, version, current_load))
+                continue
+            if current_load >= self._max_loads.get(operator_id, 0):
+                heapq.heappop(heap)
+                continue
+            if operator_id in excluded:
+                skipped.append(heapq.heappop(heap))
+                continue
+            selected = (operator_id, current_load, key)
+            break
+        for entry in skipped:
+            heapq.heappush(heap, entry)
+        return selected
 
-        selected_operator = operators[0]
-        current_load = self._get_operator_load(
-            db, selected_operator.id)
+    def select_operator(
+        self,
+        db: Session,
+        source_id: int,
+        excluded_operator_ids: Optional[List[int]] = None,
+        loads: Optional[Dict[int, int]] = None
+    ) -> Optional[DistributionResult]:
+        excluded = set(excluded_operator_ids or [])
+        if loads is None:
+            self.registry.ensure_loaded(db)
+
+        operators = None
+        while True:
+            with self._lock:
+                if operators is not None and self._needs_rebuild(source_id):
+                    self._install_heap(source_id, operators)
+                if not self._needs_rebuild(source_id):
+                    selected = self._pop_available(
+                        db, source_id, excluded, loads)
+                    break
+            operators = self._read_source(db, source_id, loads)
+
+        if selected is None:
+            return None
+        operator_id, current_load, key = selected
 
-        if current_load >= selected_operator.load_limit:
+        selected_operator = db.get(Operator, operator_id)
+        if selected_operator is None:
+            self.invalidate()
             return None
 
         return DistributionResult(
+            success=True,
             operator=selected_operator,
             strategy=self.__class__.__name__,
             details={
+                'weight': self._weights.get(source_id, {}).get(operator_id),
                 'current_load': current_load,
-                'load_limit': selected_operator.load_limit
+                'load_limit': selected_operator.max_load
             }
         )
 
@@ -188,27 +596,231 @@ class RoundRobinDistributionStrategy(DistributionStrategy):
 class DistributionService:
     """Сервис распределения контактов между операторами."""
 
-    def __init__(self, strategy: DistributionStrategy = None):
+    # Сколько раз выбирать другого оператора, если слот выбранного
+    # успел занять параллельный запрос
+    max_reserve_attempts = 5
+
+    def __init__(
+        self,
+        strategy: DistributionStrategy = None,
+        affinity: Optional[TTLCache[int]] = None
+    ):
         self.strategy = strategy or WeightedDistributionStrategy()
+        self.affinity = affinity
 
     def distribute(
         self,
         db: Session,
         source_id: int,
-        excluded_operator_ids: Optional[List[int]] = None
+        excluded_operator_ids: Optional[List[int]] = None,
+        loads: Optional[Dict[int, int]] = None,
+        reserve: bool = False,
+        lead_id: Optional[int] = None
     ) -> DistributionResult:
-        result = self.strategy.select_operator(
-            db, source_id, excluded_operator_ids)
+        """
+        Выбрать оператора для обращения.
+
+        При reserve=True слот оператора атомарно резервируется в текущей
+        транзакции (operators.cached_load), а при конфликте выбирается
+        другой оператор. Если включена привязка лидов и передан lead_id,
+        обращение сначала предлагается предыдущему оператору лида, если
+        он настроен для источника. Привязка к назначенному оператору
+        запоминается вызовом remember_affinity() после коммита.
+        """
+        excluded_operator_ids = list(excluded_operator_ids or [])
+        if self.affinity is not None and lead_id is not None:
+            result = self._distribute_by_affinity(
+                db, source_id, lead_id, excluded_operator_ids, loads,
+                reserve)
+            if result is not None:
+                return result
+
+        for _ in range(self.max_reserve_attempts):
+            result = self.strategy.select_operator(
+                db, source_id, excluded_operator_ids, loads)
+            if result is None:
+                break
+            if not reserve or operator_crud.reserve_slots(
+                    db, operator_id=result.operator.id):
+                result.success = True
+                return result
+            excluded_operator_ids.append(result.operator.id)
 
-        if result is None:
-            return DistributionResult(
-                success=False,
-                operator=None,
-                error='Не найден доступный оператор'
-            )
+        return DistributionResult(
+            success=False,
+            operator=None,
+            error='Не найден доступный оператор'
+        )
 
-        result.success = True
-        return result
+    def remember_affinity(
+        self, lead_id: Optional[int], operator_id: Optional[int]
+    ) -> None:
+        """Запомнить оператора лида после коммита назначения."""
+        if self.affinity is not None and lead_id and operator_id:
+            self.affinity.set(lead_id, operator_id)
+
+    def _distribute_by_affinity(
+        self,
+        db: Session,
+        source_id: int,
+        lead_id: int,
+        excluded_operator_ids: List[int],
+        loads: Optional[Dict[int, int]],
+        reserve: bool
+    ) -> Optional[DistributionResult]:
+        """
+        Назначить предыдущего оператора лида, если он доступен и имеет
+        положительный вес в источнике обращения.
+        """
+        operator_id = self.affinity.get(lead_id)
+        if operator_id is None or operator_id in excluded_operator_ids:
+            return None
+
+        row = db.query(Operator, SourceOperatorWeight.weight).outerjoin(
+            SourceOperatorWeight, and_(
+                SourceOperatorWeight.operator_id == Operator.id,
+                SourceOperatorWeight.source_id == source_id)
+        ).filter(Operator.id == operator_id).first()
+        if row is None or not row.Operator.is_active:
+            self.affinity.delete(lead_id)
+            return None
+        # Лид пришел из источника, для которого оператор не настроен
+        operator, weight = row
+        if not weight or weight <= 0:
+            return None
+        current_load = self.strategy._get_operator_load(
+            db, operator_id, loads)
+        if current_load >= operator.max_load:
+            return None
+        if reserve and not operator_crud.reserve_slots(
+                db, operator_id=operator_id):
+            return None
+
+        return DistributionResult(
+            success=True,
+            operator=operator,
+            strategy='LeadAffinity',
+            details={
+                'weight': weight,
+                'current_load': current_load,
+                'load_limit': operator.max_load
+            }
+        )
+
+    def distribute_batch(
+        self,
+        db: Session,
+        source_id: int,
+        count: int,
+        reserve: bool = False
+    ) -> List[DistributionResult]:
+        """
+        Распределить count обращений одного источника.
+
+        Нагрузка операторов читается один раз, а каждое назначение сразу
+        резервирует слот в снимке, поэтому пакет не превышает max_load.
+        При reserve=True слоты затем резервируются в БД одним UPDATE на
+        оператора; не поместившиеся обращения остаются без оператора.
+        """
+        # Кэш стратегии перестраивается, чтобы весь пакет видел актуальные
+        # веса и лимиты
+        self.strategy.invalidate(source_id)
+        loads = self.strategy.load_snapshot(db)
+        results = []
+        for _ in range(count):
+            result = self.distribute(db, source_id, loads=loads)
+            results.append(result)
+            if not result.success:
+                # Нагрузка в снимке только растет: дальше мест тоже нет
+                results.extend([result] * (count - len(results)))
+                break
+            operator_id = result.operator.id
+            loads[operator_id] = loads.get(operator_id, 0) + 1
+
+        if reserve:
+            self._reserve_batch(db, results)
+        return results
+
+    def _reserve_batch(
+        self, db: Session, results: List[DistributionResult]
+    ) -> None:
+        assigned: Dict[int, List[int]] = {}
+        for i, result in enumerate(results):
+            if result.success:
+                assigned.setdefault(result.operator.id, []).append(i)
+
+        for operator_id, indexes in assigned.items():
+            reserved = operator_crud.reserve_slots(
+                db, operator_id=operator_id, count=len(indexes))
+            for i in indexes[reserved:]:
+                results[i] = DistributionResult(
+                    success=False,
+                    operator=None,
+                    error='Не найден доступный оператор'
+                )
 
     def set_strategy(self, strategy: DistributionStrategy):
+        self.strategy.close()
         self.strategy = strategy
+
+    def invalidate(self, source_id: Optional[int] = None) -> None:
+        self.strategy.invalidate(source_id)
+
+    def persist_state(self, db: Session) -> None:
+        self.strategy.persist_state(db)
+
+
+class AsyncDistributionService:
+    """
+    Асинхронная обертка над DistributionService для AsyncSession.
+
+    Стратегии работают с синхронной сессией через AsyncSession.run_sync,
+    поэтому кэши стратегий и реестр нагрузки общие с синхронным сервисом.
+    """
+
+    def __init__(self, service: DistributionService):
+        self.service = service
+
+    async def distribute(
+        self,
+        db: AsyncSession,
+        source_id: int,
+        excluded_operator_ids: Optional[List[int]] = None,
+        reserve: bool = False,
+        lead_id: Optional[int] = None
+    ) -> DistributionResult:
+        return await db.run_sync(
+            self.service.distribute, source_id, excluded_operator_ids,
+            reserve=reserve, lead_id=lead_id)
+
+    def remember_affinity(
+        self, lead_id: Optional[int], operator_id: Optional[int]
+    ) -> None:
+        self.service.remember_affinity(lead_id, operator_id)
+
+    async def distribute_batch(
+        self,
+        db: AsyncSession,
+        source_id: int,
+        count: int,
+        reserve: bool = False
+    ) -> List[DistributionResult]:
+        return await db.run_sync(
+            self.service.distribute_batch, source_id, count,
+            reserve=reserve)
+
+
+STRATEGIES = {
+    'weighted': WeightedDistributionStrategy,
+    'round_robin': RoundRobinDistributionStrategy,
+    'least_loaded': LeastLoadedDistributionStrategy,
+}
+
+distribution_service = DistributionService(
+    STRATEGIES[settings.DISTRIBUTION_STRATEGY](),
+    affinity=TTLCache(
+        maxsize=settings.DISTRIBUTION_AFFINITY_SIZE,
+        ttl=settings.DISTRIBUTION_AFFINITY_TTL
+    ) if settings.DISTRIBUTION_AFFINITY_ENABLED else None
+)
+async_distribution_service = AsyncDistributionService(distribution_service)
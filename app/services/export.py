@@ -0,0 +1,74 @@
+import csv
+import io
+import json
+from typing import Iterator, Optional
+
+from app.core.config import settings
+from app.crud.contact import EXPORT_COLUMNS
+from app.crud.contact import contact as contact_crud
+from app.database.session import READ_ONLY, SessionLocal, engine
+
+EXPORT_MEDIA_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+EXPORT_FIELDS = [column.key for column in EXPORT_COLUMNS]
+
+
+def _format_csv(rows, batch_size: int) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    # Заголовок отдается сразу, до чтения первой пачки
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _format_ndjson(rows, batch_size: int) -> Iterator[str]:
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row._asdict(), default=str) + '\n')
+        if len(lines) >= batch_size:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+
+def export_contacts(
+    fmt: str, *, source_id: Optional[int] = None,
+    operator_id: Optional[int] = None, is_active: Optional[bool] = None,
+    batch_size: int = settings.EXPORT_BATCH_SIZE
+) -> Iterator[str]:
+    """
+    Выгрузка обращений в формате fmt ('csv' или 'ndjson') кусками по
+    batch_size строк. Строки читаются из курсора БД по мере отправки
+    ответа, поэтому расход памяти не зависит от размера выгрузки.
+    """
+    # Сессия открывается здесь, а не через Depends: ответ формируется
+    # потоково и живет дольше обработчика
+    db = SessionLocal(bind=engine.execution_options(**READ_ONLY))
+    try:
+        rows = contact_crud.iter_export_rows(
+            db,
+            source_id=source_id,
+            operator_id=operator_id,
+            is_active=is_active,
+            batch_size=batch_size
+        )
+        if fmt == 'csv':
+            yield from _format_csv(rows, batch_size)
+        else:
+            yield from _format_ndjson(rows, batch_size)
+    finally:
+        db.close()
@@ -0,0 +1,126 @@
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, NamedTuple, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.models.idempotency import IdempotencyKey
+from app.services.jobs import PeriodicJob, run_in_session
+
+logger = logging.getLogger(__name__)
+
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+
+class StoredResponse(NamedTuple):
+    request_hash: str
+    status_code: int
+    body: Dict[str, Any]
+    expires_at: datetime
+
+
+class IdempotencyStore:
+    """
+    Хранилище ответов по Idempotency-Key: таблица idempotency_keys
+    с кэшем в памяти процесса перед ней.
+
+    Ключ записывается в той же транзакции, что и результат запроса,
+    поэтому из двух одновременных запросов с одним ключом фиксируется
+    только первый, а второй получает его ответ.
+    """
+
+    def __init__(self, ttl: int, cache_size: int):
+        self.ttl = ttl
+        self.cache: TTLCache[StoredResponse] = TTLCache(cache_size, ttl)
+
+    @staticmethod
+    def fingerprint(request: BaseModel) -> str:
+        return hashlib.sha256(request.model_dump_json().encode()).hexdigest()
+
+    def get(self, db: Session, key: str) -> Optional[StoredResponse]:
+        """Сохраненный ответ по ключу, если он еще не истек."""
+        now = datetime.utcnow()
+        stored = self.cache.get(key)
+        if stored is not None and stored.expires_at > now:
+            return stored
+        record = db.query(IdempotencyKey).filter(
+            IdempotencyKey.key == key,
+            IdempotencyKey.expires_at > now
+        ).first()
+        if record is None:
+            return None
+        stored = StoredResponse(
+            record.request_hash, record.status_code, record.response,
+            record.expires_at)
+        self.cache.set(key, stored)
+        return stored
+
+    def add(
+        self, db: Session, key: str, request_hash: str, status_code: int,
+        body: Dict[str, Any]
+    ) -> StoredResponse:
+        """
+        Добавить ответ в текущую транзакцию, не коммитя ее. Просроченная
+        запись с тем же ключом, которую еще не удалила очистка,
+        заменяется. В кэш ответ попадает через remember() после
+        успешного commit.
+        """
+        now = datetime.utcnow()
+        stored = StoredResponse(
+            request_hash, status_code, body,
+            now + timedelta(seconds=self.ttl))
+        db.query(IdempotencyKey).filter(
+            IdempotencyKey.key == key,
+            IdempotencyKey.expires_at <= now
+        ).delete(synchronize_session=False)
+        db.add(IdempotencyKey(
+            key=key,
+            request_hash=request_hash,
+            status_code=status_code,
+            response=body,
+            expires_at=stored.expires_at
+        ))
+        return stored
+
+    def remember(self, key: str, stored: StoredResponse) -> None:
+        self.cache.set(key, stored)
+
+    @staticmethod
+    def replay(stored: StoredResponse, request_hash: str) -> JSONResponse:
+        """Повторить сохраненный ответ; ключ от другого запроса - 422."""
+        if stored.request_hash != request_hash:
+            raise HTTPException(
+                status_code=422,
+                detail='Idempotency-Key was used with a different request'
+            )
+        return JSONResponse(
+            content=stored.body,
+            status_code=stored.status_code,
+            headers={REPLAYED_HEADER: 'true'}
+        )
+
+    def purge_expired(self, db: Session) -> int:
+        """Удалить просроченные ключи, вернуть их число."""
+        deleted = db.query(IdempotencyKey).filter(
+            IdempotencyKey.expires_at <= datetime.utcnow()
+        ).delete(synchronize_session=False)
+        db.commit()
+        if deleted:
+            logger.info('Purged %s expired idempotency keys', deleted)
+        return deleted
+
+
+idempotency_store = IdempotencyStore(
+    settings.IDEMPOTENCY_TTL, settings.IDEMPOTENCY_CACHE_SIZE)
+
+idempotency_cleanup_job = PeriodicJob(
+    'idempotency-cleanup',
+    settings.IDEMPOTENCY_CLEANUP_INTERVAL,
+    run_in_session(idempotency_store.purge_expired),
+)
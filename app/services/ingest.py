@@ -0,0 +1,145 @@
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+from starlette.responses import StreamingResponse
+
+from app.core.config import settings
+from app.database.session import AsyncSessionLocal
+from app.schemas.contact import ContactCreate
+from app.services.intake import bulk_create_contacts, get_existing_source_ids
+
+
+class NDJSONStreamingResponse(StreamingResponse):
+    """
+    Потоковый NDJSON-ответ, который формируется одновременно с чтением
+    тела запроса.
+
+    Стандартный StreamingResponse параллельно ждет отключения клиента
+    через receive и забирал бы себе куски тела запроса, поэтому здесь
+    ответ только отправляется; отключение клиента проявится как ошибка
+    чтения тела.
+    """
+
+    media_type = 'application/x-ndjson'
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+def _process_chunk(
+    db: Session,
+    chunk: List[Tuple[int, Optional[bytes]]],
+    known_source_ids: Set[int]
+) -> List[Dict[str, Any]]:
+    """Разобрать и сохранить пачку строк, вернуть результат по строкам."""
+    results: Dict[int, Dict[str, Any]] = {}
+    parsed: List[Tuple[int, ContactCreate]] = []
+    for line_no, line in chunk:
+        if line is None:
+            results[line_no] = {
+                'line': line_no,
+                'status': 'error',
+                'error': f'Line is longer than '
+                         f'{settings.INGEST_MAX_LINE_LENGTH} bytes'
+            }
+            continue
+        try:
+            parsed.append(
+                (line_no, ContactCreate.model_validate_json(
+                    line.decode(errors='replace'))))
+        except ValidationError as error:
+            results[line_no] = {
+                'line': line_no,
+                'status': 'error',
+                'error': error.errors(include_url=False)
+            }
+
+    unknown_source_ids = {
+        contact_in.source_id for _, contact_in in parsed
+    } - known_source_ids
+    known_source_ids |= get_existing_source_ids(db, unknown_source_ids)
+
+    valid: List[Tuple[int, ContactCreate]] = []
+    for line_no, contact_in in parsed:
+        if contact_in.source_id in known_source_ids:
+            valid.append((line_no, contact_in))
+        else:
+            results[line_no] = {
+                'line': line_no,
+                'status': 'error',
+                'error': 'Source not found'
+            }
+
+    assignments = bulk_create_contacts(
+        db, [contact_in for _, contact_in in valid])
+    for (line_no, _), assignment in zip(valid, assignments):
+        results[line_no] = {'line': line_no, 'status': 'created', **assignment}
+    return [results[line_no] for line_no, _ in chunk]
+
+
+async def _read_lines(
+    body: AsyncIterator[bytes],
+    max_length: int = settings.INGEST_MAX_LINE_LENGTH
+) -> AsyncIterator[Tuple[int, Optional[bytes]]]:
+    """
+    Нарезать поток байтов на непустые строки с их номерами. Строка
+    длиннее max_length байт не накапливается в памяти: вместо нее
+    выдается None, а ее остаток до перевода строки пропускается.
+    """
+    pending: List[bytes] = []
+    pending_length = 0
+    too_long = False
+    line_no = 0
+    async for data in body:
+        *lines, tail = data.split(b'\n')
+        for part in lines:
+            line_no += 1
+            if too_long or pending_length + len(part) > max_length:
+                yield line_no, None
+            else:
+                line = b''.join(pending) + part
+                if line.strip():
+                    yield line_no, line
+            pending, pending_length, too_long = [], 0, False
+        if not too_long:
+            pending_length += len(tail)
+            if pending_length > max_length:
+                pending, too_long = [], True
+            else:
+                pending.append(tail)
+    if too_long:
+        yield line_no + 1, None
+    else:
+        line = b''.join(pending)
+        if line.strip():
+            yield line_no + 1, line
+
+
+async def ingest_ndjson(
+    body: AsyncIterator[bytes],
+    chunk_size: int = settings.INGEST_CHUNK_SIZE
+) -> AsyncIterator[bytes]:
+    """
+    Загрузить обращения из NDJSON-потока пачками по chunk_size строк
+    и выдать результат по каждой строке в виде NDJSON.
+    """
+    known_source_ids: Set[int] = set()
+    # Сессия открывается здесь, а не через Depends: ответ формируется
+    # потоково и живет дольше обработчика
+    async with AsyncSessionLocal() as db:
+        chunk: List[Tuple[int, Optional[bytes]]] = []
+        async for item in _read_lines(body):
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                for result in await db.run_sync(
+                        _process_chunk, chunk, known_source_ids):
+                    yield json.dumps(result, default=str).encode() + b'\n'
+                chunk = []
+        if chunk:
+            for result in await db.run_sync(
+                    _process_chunk, chunk, known_source_ids):
+                yield json.dumps(result, default=str).encode() + b'\n'
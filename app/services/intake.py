@@ -0,0 +1,95 @@
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Set
+
+from sqlalchemy.orm import Session
+
+from app.crud.lead import lead as lead_crud
+from app.models.contact import Contact
+from app.models.source import Source
+from app.schemas.contact import ContactCreate
+from app.schemas.lead import LeadCreate
+from app.services.distribution import distribution_service
+from app.services.load_registry import load_registry
+
+
+def get_existing_source_ids(
+    db: Session, source_ids: Iterable[int]
+) -> Set[int]:
+    """Какие из переданных источников существуют, одним запросом."""
+    source_ids = set(source_ids)
+    if not source_ids:
+        return set()
+    return {
+        source_id for source_id, in db.query(Source.id).filter(
+            Source.id.in_(source_ids))
+    }
+
+
+def bulk_create_contacts(
+    db: Session, contacts_in: List[ContactCreate]
+) -> List[Dict[str, Any]]:
+    """
+    Создать пачку обращений в одной транзакции.
+
+    Лиды находятся или создаются запросами IN, операторы распределяются
+    пакетно по каждому источнику с резервированием слотов, обращения и
+    счетчики contact_count лидов записываются одним commit. Источники
+    должны быть проверены заранее. Возвращает назначения в порядке
+    contacts_in.
+    """
+    if not contacts_in:
+        return []
+
+    leads = lead_crud.get_or_create_many(
+        db,
+        leads_in=(
+            LeadCreate(
+                external_id=contact_in.lead_external_id,
+                email=contact_in.lead_email,
+                phone=contact_in.lead_phone
+            )
+            for contact_in in contacts_in
+        )
+    )
+
+    by_source: Dict[int, List[int]] = {}
+    for i, contact_in in enumerate(contacts_in):
+        by_source.setdefault(contact_in.source_id, []).append(i)
+
+    db_contacts: List[Contact] = [None] * len(contacts_in)
+    for source_id, indexes in by_source.items():
+        distribution_results = distribution_service.distribute_batch(
+            db, source_id=source_id, count=len(indexes), reserve=True)
+        for i, distribution_result in zip(indexes, distribution_results):
+            contact_in = contacts_in[i]
+            operator_id = None
+            if distribution_result.operator:
+                operator_id = distribution_result.operator.id
+            db_contacts[i] = Contact(
+                lead_id=leads[contact_in.lead_external_id].id,
+                source_id=source_id,
+                operator_id=operator_id,
+                message=contact_in.message,
+                is_active=True
+            )
+
+    db.add_all(db_contacts)
+    db.flush()
+    lead_crud.increment_contact_counts(
+        db, counts=Counter(db_contact.lead_id for db_contact in db_contacts))
+    # Данные ответа собираются до commit, чтобы не перечитывать объекты
+    assignments = [
+        {
+            'id': db_contact.id,
+            'lead_id': db_contact.lead_id,
+            'source_id': db_contact.source_id,
+            'operator_id': db_contact.operator_id
+        }
+        for db_contact in db_contacts
+    ]
+    db.commit()
+
+    for assignment in assignments:
+        if assignment['operator_id']:
+            load_registry.increment(assignment['operator_id'])
+    return assignments
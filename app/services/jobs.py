@@ -0,0 +1,67 @@
+import logging
+import threading
+from typing import Callable, Optional
+
+from app.database.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicJob:
+    """
+    Фоновая задача, выполняемая в отдельном потоке раз в interval секунд
+    или сразу после вызова trigger().
+    """
+
+    # Сколько ждать завершения текущего запуска при остановке, сек:
+    # ожидание интервала прерывается сразу, а поток - демон
+    stop_timeout = 5
+
+    def __init__(self, name: str, interval: float, func: Callable[[], None]):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def trigger(self) -> None:
+        """Запустить задачу, не дожидаясь очередного интервала."""
+        self._wake.set()
+
+    def start(self) -> None:
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.stop_timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            try:
+                self.func()
+            except Exception:
+                logger.exception('Job %s failed', self.name)
+
+
+def run_in_session(func: Callable) -> Callable[[], None]:
+    """Обернуть функцию func(db) для запуска в отдельной сессии БД."""
+    def job():
+        db = SessionLocal()
+        try:
+            func(db)
+        finally:
+            db.close()
+    return job
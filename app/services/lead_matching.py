@@ -0,0 +1,95 @@
+import logging
+from typing import Dict, List, Set
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.normalization import (
+    IdentityKey, identity_keys, normalize_email, normalize_phone
+)
+from app.crud.lead import lead as lead_crud
+from app.models.lead import Lead
+from app.services.jobs import PeriodicJob, run_in_session
+
+logger = logging.getLogger(__name__)
+
+# Нормализаторы контактных данных по виду идентификатора
+NORMALIZERS = (('phone', normalize_phone), ('email', normalize_email))
+
+
+def deduplicate_leads(
+    db: Session, batch_size: int = settings.LEAD_DEDUP_BATCH_SIZE
+) -> int:
+    """
+    Проиндексировать телефоны и email лидов и склеить дубли.
+
+    Лиды без идентификаторов телефона или email (созданные до индекса
+    или совпавшие с другим лидом) обходятся пачками по batch_size в
+    порядке id. Идентификаторы пачки сопоставляются одним запросом, лиды
+    с общим телефоном или email склеиваются в лида с наименьшим id, а
+    свободные идентификаторы привязываются к нему. Лиду, чей телефон
+    или email не нормализуется, привязывается метка invalid:<id> этого
+    вида, чтобы следующие запуски его не выбирали. Каждая пачка
+    коммитится отдельно. Возвращает число удаленных дублей.
+    """
+    after_id = 0
+    merged = 0
+    while True:
+        leads = lead_crud.get_unindexed(
+            db, after_id=after_id, limit=batch_size)
+        if not leads:
+            break
+        after_id = leads[-1].id
+
+        keys_by_lead = {
+            lead.id: identity_keys(lead.external_id, lead.email, lead.phone)
+            for lead in leads
+        }
+        owners: Dict[IdentityKey, Lead] = lead_crud.match_identities(
+            db, keys={key for keys in keys_by_lead.values() for key in keys})
+        new_keys: Set[IdentityKey] = set()
+        moved: List[IdentityKey] = []
+        removed: Set[int] = set()
+        for lead in leads:
+            if lead.id in removed:
+                continue
+            keys = keys_by_lead[lead.id]
+            group = {owners[key] for key in keys if key in owners}
+            group.add(lead)
+            survivor = min(group, key=lambda member: member.id)
+            for duplicate in group - {survivor}:
+                moved += lead_crud.merge(
+                    db, survivor_id=survivor.id, duplicate_id=duplicate.id)
+                removed.add(duplicate.id)
+                for key, owner in owners.items():
+                    if owner is duplicate:
+                        owners[key] = survivor
+                merged += 1
+            for key in keys:
+                if key not in owners:
+                    owners[key] = survivor
+                    new_keys.add(key)
+
+        markers = [
+            (lead.id, kind, f'invalid:{lead.id}')
+            for lead in leads if lead.id not in removed
+            for kind, normalize in NORMALIZERS
+            if getattr(lead, kind) and normalize(getattr(lead, kind)) is None
+        ]
+        lead_crud.add_identities(db, identities=[
+            (owners[key].id, *key) for key in new_keys] + markers)
+        db.commit()
+        lead_crud.invalidate(moved)
+        if len(leads) < batch_size:
+            break
+
+    if merged:
+        logger.info('Merged %s duplicate leads', merged)
+    return merged
+
+
+lead_dedup_job = PeriodicJob(
+    'lead-dedup',
+    settings.LEAD_DEDUP_INTERVAL,
+    run_in_session(deduplicate_leads),
+)
@@ -0,0 +1,131 @@
+import logging
+import threading
+import weakref
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.crud.contact import contact as contact_crud
+
+logger = logging.getLogger(__name__)
+
+LoadListener = Callable[[Optional[int], Optional[int]], None]
+
+
+class OperatorLoadRegistry:
+    """
+    Реестр текущей нагрузки операторов в памяти процесса.
+
+    Загружается из БД один раз и далее обновляется инкрементально
+    при создании обращений и изменении их статуса. Расхождения с БД
+    исправляются методом reconcile.
+
+    Подписчики (subscribe) получают (operator_id, новая нагрузка) при
+    каждом изменении и (None, None) после полной перезагрузки. Методы
+    объектов хранятся по слабой ссылке: подписка не держит объект и
+    пропадает вместе с ним.
+    """
+
+    def __init__(self):
+        self._loads: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._listeners: List[Callable[[], Optional[LoadListener]]] = []
+
+    def subscribe(self, listener: LoadListener) -> None:
+        if hasattr(listener, '__self__'):
+            ref = weakref.WeakMethod(listener)
+        else:
+            ref = lambda: listener  # noqa: E731
+        with self._lock:
+            self._listeners.append(ref)
+
+    def unsubscribe(self, listener: LoadListener) -> None:
+        with self._lock:
+            self._listeners = [
+                ref for ref in self._listeners
+                if ref() is not None and ref() != listener
+            ]
+
+    def _notify(
+        self, operator_id: Optional[int], load: Optional[int]
+    ) -> None:
+        listeners = [ref() for ref in self._listeners]
+        if None in listeners:
+            with self._lock:
+                self._listeners = [
+                    ref for ref in self._listeners if ref() is not None]
+        for listener in listeners:
+            if listener is not None:
+                listener(operator_id, load)
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def load(self, db: Session) -> None:
+        """Полностью перечитать нагрузку операторов из БД."""
+        loads = contact_crud.get_open_load_by_operator(db)
+        with self._lock:
+            self._loads = loads
+            self._loaded = True
+        self._notify(None, None)
+
+    def ensure_loaded(self, db: Session) -> None:
+        if not self._loaded:
+            self.load(db)
+
+    def get(self, db: Session, operator_id: int) -> int:
+        """Получить текущую нагрузку оператора."""
+        self.ensure_loaded(db)
+        return self._loads.get(operator_id, 0)
+
+    def snapshot(self, db: Session) -> Dict[int, int]:
+        """Копия текущей нагрузки всех операторов."""
+        self.ensure_loaded(db)
+        with self._lock:
+            return dict(self._loads)
+
+    def adjust(self, operator_id: int, delta: int) -> None:
+        """Изменить нагрузку оператора на delta."""
+        if not operator_id or not delta:
+            return
+        with self._lock:
+            load = max(self._loads.get(operator_id, 0) + delta, 0)
+            if load:
+                self._loads[operator_id] = load
+            else:
+                self._loads.pop(operator_id, None)
+        self._notify(operator_id, load)
+
+    def increment(self, operator_id: int) -> None:
+        self.adjust(operator_id, 1)
+
+    def decrement(self, operator_id: int) -> None:
+        self.adjust(operator_id, -1)
+
+    def reconcile(self, db: Session) -> Dict[int, Tuple[int, int]]:
+        """
+        Сверить реестр с БД и исправить расхождения.
+
+        Возвращает словарь operator_id -> (значение в памяти, значение в БД)
+        для операторов, по которым найдено расхождение.
+        """
+        actual = contact_crud.get_open_load_by_operator(db)
+        with self._lock:
+            drift = {
+                operator_id: (self._loads.get(operator_id, 0),
+                              actual.get(operator_id, 0))
+                for operator_id in set(self._loads) | set(actual)
+                if self._loads.get(operator_id, 0)
+                != actual.get(operator_id, 0)
+            }
+            self._loads = actual
+            self._loaded = True
+        self._notify(None, None)
+        if drift:
+            logger.warning('Operator load drift fixed: %s', drift)
+        return drift
+
+
+load_registry = OperatorLoadRegistry()
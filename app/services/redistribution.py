@@ -0,0 +1,74 @@
+import logging
+from typing import Dict, List, Set
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.crud.contact import contact as contact_crud
+from app.crud.operator import operator as operator_crud
+from app.models.contact import Contact
+from app.services.distribution import distribution_service
+from app.services.jobs import PeriodicJob, run_in_session
+from app.services.load_registry import load_registry
+
+logger = logging.getLogger(__name__)
+
+
+def redistribute_pending(
+    db: Session, batch_size: int = settings.REDISTRIBUTION_BATCH_SIZE
+) -> int:
+    """
+    Назначить операторов обращениям, оставшимся без оператора.
+
+    Очередь разбирается пачками в порядке поступления, каждая пачка
+    коммитится отдельно. Обращение занимается условным UPDATE: если
+    его уже назначил другой обработчик или закрыли, зарезервированный
+    слот возвращается. Источник, для которого не нашлось свободного
+    оператора, пропускается до конца прохода. Возвращает число
+    назначенных обращений.
+    """
+    blocked_source_ids: Set[int] = set()
+    total_assigned = 0
+    while True:
+        contacts = contact_crud.get_unassigned(
+            db, limit=batch_size, excluded_source_ids=blocked_source_ids)
+        if not contacts:
+            break
+
+        by_source: Dict[int, List[Contact]] = {}
+        for contact in contacts:
+            by_source.setdefault(contact.source_id, []).append(contact)
+
+        assigned: List[int] = []
+        for source_id, source_contacts in by_source.items():
+            results = distribution_service.distribute_batch(
+                db, source_id=source_id, count=len(source_contacts),
+                reserve=True)
+            for contact, result in zip(source_contacts, results):
+                if not result.success:
+                    blocked_source_ids.add(source_id)
+                elif contact_crud.assign_operator(
+                        db, contact_id=contact.id,
+                        operator_id=result.operator.id):
+                    assigned.append(result.operator.id)
+                else:
+                    operator_crud.adjust_cached_load(
+                        db, operator_id=result.operator.id, delta=-1)
+        db.commit()
+
+        for operator_id in assigned:
+            load_registry.increment(operator_id)
+        total_assigned += len(assigned)
+        if not assigned and len(contacts) < batch_size:
+            break
+
+    if total_assigned:
+        logger.info('Redistributed %s pending contacts', total_assigned)
+    return total_assigned
+
+
+redistribution_worker = PeriodicJob(
+    'redistribution',
+    settings.REDISTRIBUTION_INTERVAL,
+    run_in_session(redistribute_pending),
+)
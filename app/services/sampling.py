@@ -0,0 +1,138 @@
+import random
+from typing import Callable, List, Optional, Sequence
+
+from app.core.cache import TTLCache
+
+
+class AliasTable:
+    """
+    Таблица Уолкера (alias method) для выборки индекса с вероятностью,
+    пропорциональной весу, за O(1). Строится за O(n).
+    """
+
+    def __init__(self, weights: Sequence[float]):
+        n = len(weights)
+        total = float(sum(weights))
+        self.size = n
+        self._prob: List[float] = [1.0] * n
+        self._alias: List[int] = list(range(n))
+        if n == 0 or total <= 0:
+            return
+
+        scaled = [w * n / total for w in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+            self._prob[less] = scaled[less]
+            self._alias[less] = more
+            scaled[more] = scaled[more] + scaled[less] - 1.0
+            if scaled[more] < 1.0:
+                small.append(more)
+            else:
+                large.append(more)
+        # Остатки из-за погрешности округления считаются полными ячейками
+        for i in small + large:
+            self._prob[i] = 1.0
+
+    def sample(self) -> int:
+        i = random.randrange(self.size)
+        return i if random.random() < self._prob[i] else self._alias[i]
+
+
+class SourceSamplingTable:
+    """
+    Предрасчитанная таблица выбора операторов для одного источника.
+
+    Alias-таблица строится по весам операторов, а доступная емкость
+    учитывается выборкой с отклонением: кандидат принимается с
+    вероятностью available_capacity / max(max_load). Итоговая вероятность
+    выбора пропорциональна weight * available_capacity, как и при полном
+    пересчете приоритетов, но одна попытка стоит O(1).
+    """
+
+    max_attempts = 32
+
+    def __init__(
+        self,
+        operator_ids: List[int],
+        weights: List[int],
+        max_loads: List[int]
+    ):
+        self.operator_ids = operator_ids
+        self.weights = weights
+        self.max_loads = max_loads
+        self.capacity_bound = max(max_loads, default=0)
+        self.alias = AliasTable(weights)
+
+    def __len__(self) -> int:
+        return len(self.operator_ids)
+
+    def pick(
+        self,
+        get_load: Callable[[int], int],
+        excluded_operator_ids: Sequence[int] = ()
+    ) -> Optional[int]:
+        """Выбрать индекс оператора или None, если свободных нет."""
+        if not self.operator_ids or self.capacity_bound <= 0:
+            return None
+        excluded = set(excluded_operator_ids)
+        if self.alias.size and sum(self.weights) > 0:
+            for _ in range(self.max_attempts):
+                i = self.alias.sample()
+                if self.operator_ids[i] in excluded:
+                    continue
+                capacity = (
+                    self.max_loads[i] - get_load(self.operator_ids[i]))
+                if capacity > 0 and (
+                        random.random() * self.capacity_bound < capacity):
+                    return i
+        return self._pick_exact(get_load, excluded)
+
+    def _pick_exact(
+        self,
+        get_load: Callable[[int], int],
+        excluded: set
+    ) -> Optional[int]:
+        """
+        Точный выбор полным проходом, если большинство операторов
+        заполнено и выборка с отклонением не дала результата.
+        """
+        indexes = []
+        priorities = []
+        for i, operator_id in enumerate(self.operator_ids):
+            if operator_id in excluded:
+                continue
+            capacity = self.max_loads[i] - get_load(operator_id)
+            if capacity > 0:
+                indexes.append(i)
+                priorities.append(self.weights[i] * capacity)
+        if not indexes:
+            return None
+        if sum(priorities) == 0:
+            return random.choice(indexes)
+        return random.choices(indexes, weights=priorities, k=1)[0]
+
+
+class SamplingTableCache:
+    """
+    Кэш таблиц выбора по source_id. Таблица живет не дольше ttl секунд:
+    веса и операторов могут изменить другие процессы приложения, а
+    invalidate() сбрасывает кэш только в текущем.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 10_000):
+        self._tables: TTLCache[SourceSamplingTable] = TTLCache(maxsize, ttl)
+
+    def get(self, source_id: int) -> Optional[SourceSamplingTable]:
+        return self._tables.get(source_id)
+
+    def set(self, source_id: int, table: SourceSamplingTable) -> None:
+        self._tables.set(source_id, table)
+
+    def invalidate(self, source_id: Optional[int] = None) -> None:
+        if source_id is None:
+            self._tables.clear()
+        else:
+            self._tables.delete(source_id)
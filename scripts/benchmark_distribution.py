@@ -0,0 +1,267 @@
+"""
+Бенчмарк стратегий распределения.
+
+Заполняет локальную SQLite БД операторами, источниками и весами, затем
+прогоняет поток обращений (синтетический или из JSONL-файла) через
+DistributionService и печатает выборов в секунду, p50/p99 задержки,
+число SQL-запросов на выбор и отклонение фактической доли операторов
+от ожидаемой.
+
+    python -m scripts.benchmark_distribution --operators 200 --picks 20000
+    python -m scripts.benchmark_distribution --replay requests.jsonl
+    python -m scripts.benchmark_distribution --strategy least_loaded --persist
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import zlib
+from collections import Counter
+from typing import Dict, Iterator, List, Optional
+
+
+STRATEGIES = {
+    'weighted': 'WeightedDistributionStrategy',
+    'round_robin': 'RoundRobinDistributionStrategy',
+    'least_loaded': 'LeastLoadedDistributionStrategy',
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--operators', type=int, default=200)
+    parser.add_argument('--sources', type=int, default=5)
+    parser.add_argument(
+        '--operators-per-source', type=int, default=None,
+        help='по умолчанию все операторы получают вес в каждом источнике')
+    parser.add_argument('--max-load', type=int, default=1000)
+    parser.add_argument('--max-weight', type=int, default=100)
+    parser.add_argument('--picks', type=int, default=10000,
+                        help='размер синтетического потока')
+    parser.add_argument('--replay', metavar='JSONL',
+                        help='файл с обращениями, по одному JSON в строке')
+    parser.add_argument('--strategy', default='weighted',
+                        choices=sorted(STRATEGIES))
+    parser.add_argument('--load-source', choices=('registry', 'db'),
+                        default='registry')
+    parser.add_argument('--persist', action='store_true',
+                        help='сохранять обращения и резервировать слоты')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--top', type=int, default=10,
+                        help='сколько операторов с наибольшим отклонением '
+                             'показать')
+    parser.add_argument(
+        '--database-url',
+        help='БД для бенчмарка (по умолчанию временная SQLite)')
+    return parser.parse_args()
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+def seed_database(db, args) -> Dict[int, Dict[int, int]]:
+    """Создать операторов, источники и веса; вернуть веса по источникам."""
+    from app.models import Lead, Operator, Source, SourceOperatorWeight
+
+    db.add(Lead(external_id=f'bench-lead-{time.time()}'))
+    operators = [
+        Operator(name=f'bench-{i}', max_load=args.max_load)
+        for i in range(args.operators)
+    ]
+    sources = [
+        Source(name=f'bench-{i}-{time.time()}')
+        for i in range(args.sources)
+    ]
+    db.add_all(operators + sources)
+    db.flush()
+
+    weights: Dict[int, Dict[int, int]] = {}
+    per_source = args.operators_per_source or len(operators)
+    for source in sources:
+        chosen = random.sample(operators, min(per_source, len(operators)))
+        weights[source.id] = {
+            operator.id: random.randint(1, args.max_weight)
+            for operator in chosen
+        }
+        db.add_all(
+            SourceOperatorWeight(
+                source_id=source.id, operator_id=operator_id, weight=weight)
+            for operator_id, weight in weights[source.id].items()
+        )
+    db.commit()
+    return weights
+
+
+def contact_stream(
+    args, source_ids: List[int]
+) -> Iterator[Dict[str, object]]:
+    """
+    Поток обращений. Строки JSONL могут содержать source_id и
+    lead_external_id; иначе источник выбирается по хэшу строки, а
+    идентификатором лида служит request_id или номер строки.
+    """
+    if not args.replay:
+        for i in range(args.picks):
+            yield {
+                'source_id': random.choice(source_ids),
+                'lead_external_id': f'bench-lead-{i}'
+            }
+        return
+
+    with open(args.replay, encoding='utf-8') as replay:
+        for line_no, line in enumerate(replay):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            source_id = item.get('source_id')
+            if source_id not in source_ids:
+                source_id = source_ids[
+                    zlib.crc32(line.encode()) % len(source_ids)]
+            yield {
+                'source_id': source_id,
+                'lead_external_id': str(
+                    item.get('lead_external_id')
+                    or item.get('request_id') or line_no)
+            }
+
+
+def expected_shares(
+    strategy_name: str, weights: Dict[int, int]
+) -> Dict[int, float]:
+    """
+    Ожидаемая доля операторов источника. Для weighted - при пустой
+    нагрузке (с --persist доли отклоняются сильнее). least_loaded
+    выравнивает нагрузку / max_load / вес, поэтому при равных max_load
+    доли пропорциональны весам только с --persist: без сохранения
+    нагрузка не меняется и все обращения получает один оператор.
+    Нагрузка оператора общая для всех источников, поэтому с несколькими
+    источниками доли least_loaded по источнику тоже отклоняются.
+    """
+    if strategy_name in ('weighted', 'least_loaded'):
+        total = sum(weights.values())
+        return {
+            operator_id: weight / total
+            for operator_id, weight in weights.items()
+        }
+    return {operator_id: 1 / len(weights) for operator_id in weights}
+
+
+def main():
+    args = parse_args()
+    if args.strategy == 'least_loaded' and not args.persist:
+        print('least_loaded requires --persist: without it operator load '
+              'never changes and every pick goes to the same operator',
+              file=sys.stderr)
+        return 2
+    random.seed(args.seed)
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+
+    from sqlalchemy import event
+
+    from app.database.session import SessionLocal, engine, init_db
+    from app.models import Contact, Lead
+    from app.services import distribution
+    from app.services.load_registry import load_registry
+
+    init_db()
+    strategy_cls = getattr(distribution, STRATEGIES[args.strategy])
+    if args.strategy == 'weighted':
+        strategy = strategy_cls(load_source=args.load_source)
+    else:
+        strategy = strategy_cls()
+    service = distribution.DistributionService(strategy)
+
+    db = SessionLocal()
+    try:
+        weights = seed_database(db, args)
+        load_registry.load(db)
+        source_ids = list(weights)
+        lead_id = db.query(Lead.id).order_by(Lead.id.desc()).scalar()
+
+        queries = 0
+
+        def count_query(*_):
+            nonlocal queries
+            queries += 1
+
+        event.listen(engine, 'before_cursor_execute', count_query)
+
+        latencies: List[float] = []
+        picks: Dict[int, Counter] = {
+            source_id: Counter() for source_id in source_ids}
+        failures = 0
+        started = time.perf_counter()
+        for item in contact_stream(args, source_ids):
+            source_id = item['source_id']
+            pick_started = time.perf_counter()
+            result = service.distribute(
+                db, source_id, reserve=args.persist)
+            operator_id: Optional[int] = (
+                result.operator.id if result.success else None)
+            if args.persist:
+                db.add(Contact(
+                    lead_id=lead_id, source_id=source_id,
+                    operator_id=operator_id, is_active=True))
+                db.commit()
+                load_registry.increment(operator_id)
+            latencies.append(time.perf_counter() - pick_started)
+            if operator_id is None:
+                failures += 1
+            else:
+                picks[source_id][operator_id] += 1
+        elapsed = time.perf_counter() - started
+        event.remove(engine, 'before_cursor_execute', count_query)
+    finally:
+        db.close()
+
+    total = len(latencies)
+    print(f'strategy:        {args.strategy} ({args.load_source})')
+    print(f'operators:       {args.operators}, sources: {args.sources}')
+    print(f'picks:           {total} ({failures} without operator)')
+    if not total:
+        return 0
+    print(f'picks/sec:       {total / elapsed:,.0f}')
+    print(f'latency p50:     {percentile(latencies, 0.5) * 1000:.3f} ms')
+    print(f'latency p99:     {percentile(latencies, 0.99) * 1000:.3f} ms')
+    print(f'latency mean:    {statistics.mean(latencies) * 1000:.3f} ms')
+    print(f'queries/pick:    {queries / total:.2f}')
+
+    deviations = []
+    for source_id, counter in picks.items():
+        assigned = sum(counter.values())
+        if not assigned:
+            continue
+        expected = expected_shares(args.strategy, weights[source_id])
+        for operator_id, share in expected.items():
+            observed = counter[operator_id] / assigned
+            deviations.append((
+                abs(observed - share), source_id, operator_id,
+                observed, share))
+    deviations.sort(reverse=True)
+    if deviations:
+        print(f'max share drift: {deviations[0][0] * 100:.3f} pp')
+        print(f'mean share drift: '
+              f'{statistics.mean(d[0] for d in deviations) * 100:.3f} pp')
+        print('source  operator  observed  expected')
+        for _, source_id, operator_id, observed, share in (
+                deviations[:args.top]):
+            print(f'{source_id:>6}  {operator_id:>8}  '
+                  f'{observed * 100:7.3f}%  {share * 100:7.3f}%')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
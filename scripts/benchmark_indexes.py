@@ -0,0 +1,229 @@
+"""
+Бенчмарк индексов обращений.
+
+Заполняет БД обращениями без индексов из миграции
+0003_access_path_indexes, печатает планы и задержки типовых запросов
+(нагрузка операторов, списки по источнику и оператору, история лида,
+веса источника), затем применяет миграцию и повторяет замеры.
+
+    python -m scripts.benchmark_indexes --contacts 5000000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Tuple
+
+INDEXES = (
+    ('contacts', 'ix_contacts_unassigned'),
+    ('contacts', 'ix_contacts_operator_load'),
+    ('contacts', 'ix_contacts_source_id_id'),
+    ('contacts', 'ix_contacts_operator_id_id'),
+    ('contacts', 'ix_contacts_lead_id_id'),
+    ('contacts', 'ix_contacts_created_at'),
+    ('source_operator_weights', 'ix_source_operator_weights_source_operator'),
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--contacts', type=int, default=5_000_000)
+    parser.add_argument('--leads', type=int, default=None,
+                        help='по умолчанию contacts / 3')
+    parser.add_argument('--operators', type=int, default=500)
+    parser.add_argument('--sources', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=20,
+                        help='повторов каждого запроса для задержки')
+    parser.add_argument('--chunk', type=int, default=50_000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument(
+        '--database-url',
+        help='БД для бенчмарка (по умолчанию временная SQLite)')
+    return parser.parse_args()
+
+
+def seed_database(engine, args) -> None:
+    """Заполнить БД операторами, источниками, лидами и обращениями."""
+    from sqlalchemy import insert
+
+    from app.models import Contact, Lead, Operator, Source
+    from app.models.contact import OPEN_STATUSES
+    from app.models.source import SourceOperatorWeight
+
+    rng = random.Random(args.seed)
+    leads = args.leads or max(args.contacts // 3, 1)
+    statuses = OPEN_STATUSES + ('closed',)
+    with engine.begin() as conn:
+        conn.execute(insert(Operator), [
+            {'name': f'bench-{i}', 'max_load': 10_000, 'cached_load': 0}
+            for i in range(args.operators)
+        ])
+        conn.execute(insert(Source), [
+            {'name': f'bench-{i}'} for i in range(args.sources)])
+        conn.execute(insert(SourceOperatorWeight), [
+            {'source_id': source_id, 'operator_id': operator_id,
+             'weight': rng.randint(1, 100)}
+            for source_id in range(1, args.sources + 1)
+            for operator_id in range(1, args.operators + 1)
+        ])
+        for start in range(0, leads, args.chunk):
+            conn.execute(insert(Lead), [
+                {'external_id': f'bench-lead-{i}'}
+                for i in range(start, min(start + args.chunk, leads))
+            ])
+
+    started = datetime.utcnow() - timedelta(days=365)
+    step = timedelta(days=365) / args.contacts
+    for start in range(0, args.contacts, args.chunk):
+        rows = []
+        for i in range(start, min(start + args.chunk, args.contacts)):
+            rows.append({
+                'lead_id': rng.randint(1, leads),
+                'source_id': rng.randint(1, args.sources),
+                # Около 2% обращений в очереди без оператора
+                'operator_id': (
+                    rng.randint(1, args.operators)
+                    if rng.random() > 0.02 else None),
+                'status': rng.choice(statuses),
+                'is_active': rng.random() > 0.3,
+                'message': 'bench',
+                'created_at': started + i * step,
+            })
+        with engine.begin() as conn:
+            conn.execute(insert(Contact), rows)
+        print(f'\rseeded {start + len(rows)}/{args.contacts}', end='',
+              flush=True)
+    print()
+
+
+def build_cases(args) -> List[Tuple[str, Callable]]:
+    from sqlalchemy import func
+
+    from app.crud.contact import contact as contact_crud
+    from app.models import Contact
+    from app.services.distribution import WeightedDistributionStrategy
+
+    strategy = WeightedDistributionStrategy(load_source='db')
+    operator_id = args.operators // 2
+    source_id = args.sources // 2
+    lead_id = max((args.leads or args.contacts // 3) // 2, 1)
+
+    def operator_load(db):
+        return db.query(func.count(Contact.id)).filter(
+            Contact.operator_id == operator_id, Contact.is_open).scalar()
+
+    return [
+        ('load of all operators', contact_crud.get_open_load_by_operator),
+        ('load of one operator', operator_load),
+        ('operators for source', lambda db: strategy.get_available_operators(
+            db, source_id)),
+        ('contacts by source', lambda db: contact_crud.get_multi_with_details(
+            db, source_id=source_id, limit=100)),
+        ('contacts by source, deep', lambda db: (
+            contact_crud.get_multi_with_details(
+                db, source_id=source_id, limit=100,
+                after_id=args.contacts * 9 // 10))),
+        ('active by operator', lambda db: contact_crud.get_multi_with_details(
+            db, operator_id=operator_id, is_active=True, limit=100)),
+        ('lead history', lambda db: contact_crud.get_by_lead_id_with_details(
+            db, lead_id=lead_id)),
+        ('unassigned queue', lambda db: contact_crud.get_unassigned(
+            db, limit=500)),
+    ]
+
+
+def measure(engine, session_factory, cases, repeat) -> Dict[str, Tuple]:
+    """Задержка p50 и план первого запроса для каждого случая."""
+    from sqlalchemy import event
+
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    results = {}
+    for name, case in cases:
+        timings = []
+        for i in range(repeat):
+            db = session_factory()
+            try:
+                if i == 0:
+                    event.listen(engine, 'before_cursor_execute', capture)
+                started = time.perf_counter()
+                case(db)
+                timings.append(time.perf_counter() - started)
+            finally:
+                if i == 0:
+                    event.remove(engine, 'before_cursor_execute', capture)
+                db.close()
+        statement, parameters = statements[-1]
+        statements.clear()
+        results[name] = (
+            statistics.median(timings) * 1000,
+            explain(engine, statement, parameters))
+    return results
+
+
+def explain(engine, statement, parameters) -> str:
+    prefix = (
+        'EXPLAIN QUERY PLAN ' if engine.dialect.name == 'sqlite'
+        else 'EXPLAIN ')
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.execute(prefix + statement, parameters)
+        rows = cursor.fetchall()
+    finally:
+        raw.close()
+    return '; '.join(str(row[-1]) for row in rows)
+
+
+def main():
+    args = parse_args()
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        db_path = os.path.join(tempfile.mkdtemp(), 'indexes.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+
+    from sqlalchemy import text
+
+    from app.database.migrations import add_access_path_indexes
+    from app.database.session import Base, SessionLocal, engine
+    import app.models  # noqa: F401
+
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for _, index_name in INDEXES:
+            conn.execute(text(f'DROP INDEX IF EXISTS {index_name}'))
+
+    seed_database(engine, args)
+    with engine.begin() as conn:
+        conn.execute(text('ANALYZE'))
+
+    cases = build_cases(args)
+    before = measure(engine, SessionLocal, cases, args.repeat)
+
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        add_access_path_indexes(conn)
+        conn.execute(text('ANALYZE'))
+    print(f'migration 0003_access_path_indexes: '
+          f'{time.perf_counter() - started:.1f}s')
+    after = measure(engine, SessionLocal, cases, args.repeat)
+
+    print(f'\n{"query":<28} {"before, ms":>11} {"after, ms":>10}')
+    for name, _ in cases:
+        print(f'{name:<28} {before[name][0]:>11.2f} {after[name][0]:>10.2f}')
+    for name, _ in cases:
+        print(f'\n{name}\n  before: {before[name][1]}\n'
+              f'  after:  {after[name][1]}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
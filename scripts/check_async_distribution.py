@@ -0,0 +1,104 @@
+"""
+Проверка параллельного асинхронного распределения.
+
+Для каждой стратегии сбрасывает ее кэш и запускает одновременно много
+вызовов AsyncDistributionService.distribute в одном event loop, как
+это делает POST /contacts/. Стратегия не должна блокировать event loop
+на время запросов к БД: если вызовы не завершились за --timeout
+секунд, проверка падает с трассировкой зависших потоков.
+
+    python -m scripts.check_async_distribution --concurrency 10
+"""
+import argparse
+import asyncio
+import faulthandler
+import os
+import sys
+import tempfile
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--operators', type=int, default=20)
+    parser.add_argument('--timeout', type=int, default=30)
+    return parser.parse_args()
+
+
+def seed_database(args) -> int:
+    """Создать операторов и источник с весами, вернуть id источника."""
+    from app.database.session import SessionLocal
+    from app.models import Operator, Source, SourceOperatorWeight
+
+    db = SessionLocal()
+    try:
+        operators = [
+            Operator(name=f'async-{i}', max_load=1000)
+            for i in range(args.operators)
+        ]
+        source = Source(name='async-check')
+        db.add_all(operators + [source])
+        db.flush()
+        db.add_all(
+            SourceOperatorWeight(
+                source_id=source.id, operator_id=operator.id,
+                weight=i % 10 + 1)
+            for i, operator in enumerate(operators)
+        )
+        db.commit()
+        return source.id
+    finally:
+        db.close()
+
+
+async def run_strategy(service, source_id: int, args) -> int:
+    from app.database.session import AsyncSessionLocal
+
+    async def distribute() -> bool:
+        async with AsyncSessionLocal() as db:
+            result = await service.distribute(db, source_id=source_id)
+            await db.rollback()
+            return result.success
+
+    assigned = 0
+    for _ in range(args.rounds):
+        service.service.invalidate()
+        results = await asyncio.gather(
+            *(distribute() for _ in range(args.concurrency)))
+        assigned += sum(results)
+    return assigned
+
+
+def main():
+    args = parse_args()
+    db_path = os.path.join(tempfile.mkdtemp(), 'async.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+
+    import app.models  # noqa: F401
+    from app.database.session import init_db
+    from app.services import distribution
+
+    init_db()
+    source_id = seed_database(args)
+
+    # Зависший event loop не отработает asyncio-таймаут, поэтому сторож
+    # работает в отдельном потоке и завершает процесс с кодом 1
+    faulthandler.dump_traceback_later(args.timeout, exit=True)
+    failed = False
+    for name, strategy_cls in distribution.STRATEGIES.items():
+        service = distribution.AsyncDistributionService(
+            distribution.DistributionService(strategy_cls()))
+        started = time.perf_counter()
+        assigned = asyncio.run(run_strategy(service, source_id, args))
+        total = args.concurrency * args.rounds
+        print(f'{name:<14} {assigned}/{total} assigned in '
+              f'{time.perf_counter() - started:.2f}s')
+        failed = failed or assigned != total
+    faulthandler.cancel_dump_traceback_later()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
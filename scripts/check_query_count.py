@@ -0,0 +1,116 @@
+"""
+Проверка числа SQL-запросов на запрос к API.
+
+Наполняет временную SQLite БД и вызывает списки обращений и карточки
+лида с разным размером выборки. Число запросов не должно зависеть от
+количества строк в ответе.
+
+    python -m scripts.check_query_count --sizes 10 100 1000
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--operators', type=int, default=10)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    db_path = os.path.join(tempfile.mkdtemp(), 'queries.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ.setdefault('LOAD_RECONCILE_INTERVAL', '0')
+    os.environ.setdefault('REDISTRIBUTION_INTERVAL', '0')
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+
+    from app.core.config import settings
+    from app.database.session import async_engine, engine
+    from app.main import app
+
+    api = settings.API_V1_STR
+    queries = []
+
+    def count_query(conn, cursor, statement, *_):
+        # BEGIN IMMEDIATE для SQLite - не запрос к данным
+        if not statement.startswith('BEGIN'):
+            queries.append(1)
+
+    for db_engine in (engine, async_engine.sync_engine):
+        event.listen(db_engine, 'before_cursor_execute', count_query)
+
+    def measure(client, url):
+        queries.clear()
+        response = client.get(url)
+        assert response.status_code == 200, response.text
+        return len(queries)
+
+    total = max(args.sizes)
+    with TestClient(app) as client:
+        operator_ids = [
+            client.post(f'{api}/operators/', json={
+                'name': f'queries-{i}', 'max_load': total
+            }).json()['id']
+            for i in range(args.operators)
+        ]
+        source_ids = [
+            client.post(
+                f'{api}/sources/', json={'name': f'queries-{i}'}
+            ).json()['id']
+            for i in range(2)
+        ]
+        for source_id in source_ids:
+            client.post(f'{api}/sources/{source_id}/weights/', json=[
+                {'operator_id': operator_id, 'weight': 1}
+                for operator_id in operator_ids
+            ])
+
+        lead_ids = {}
+        for size in args.sizes:
+            response = client.post(f'{api}/contacts/batch', json=[
+                {
+                    'lead_external_id': f'queries-lead-{size}',
+                    'source_id': source_ids[i % len(source_ids)]
+                }
+                for i in range(size)
+            ])
+            lead_ids[size] = response.json()['contacts'][0]['lead_id']
+
+        counts = {}
+        for size in args.sizes:
+            lead_id = lead_ids[size]
+            counts[size] = {
+                'GET /contacts/': measure(
+                    client, f'{api}/contacts/?limit={size}'),
+                'GET /leads/{id}': measure(
+                    client, f'{api}/leads/{lead_id}'),
+                'GET /leads/by-external/{id}': measure(
+                    client, f'{api}/leads/by-external/queries-lead-{size}'),
+                'GET /leads/{id}/contacts': measure(
+                    client, f'{api}/leads/{lead_id}/contacts'),
+                'GET /leads/{id}/timeline': measure(
+                    client,
+                    f'{api}/leads/{lead_id}/timeline?limit={min(size, 500)}'),
+            }
+
+    failed = False
+    for endpoint in counts[args.sizes[0]]:
+        per_size = [counts[size][endpoint] for size in args.sizes]
+        constant = len(set(per_size)) == 1
+        failed |= not constant
+        print(f'{endpoint:<30} '
+              + ' '.join(f'{size}:{count}'
+                         for size, count in zip(args.sizes, per_size))
+              + ('' if constant else '  <- grows with rows'))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,28 @@
+"""
+Сверка счетчиков contact_count лидов.
+
+Пересчитывает contact_count по обращениям (включая архивные) и
+исправляет разошедшиеся значения одним UPDATE.
+
+    python -m scripts.repair_lead_counts
+"""
+import sys
+
+
+def main():
+    import app.models  # noqa: F401
+    from app.crud.lead import lead as lead_crud
+    from app.database.session import SessionLocal, init_db
+
+    init_db()
+    db = SessionLocal()
+    try:
+        repaired = lead_crud.repair_contact_counts(db)
+    finally:
+        db.close()
+    print(f'repaired leads: {repaired}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
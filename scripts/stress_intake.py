@@ -0,0 +1,115 @@
+"""
+Нагрузочная проверка параллельного создания обращений.
+
+Запускает много потоков, которые одновременно вызывают POST /contacts/
+против временной SQLite БД, и проверяет, что ни один оператор не получил
+открытых обращений больше max_load. Ответы с ошибкой (в том числе 500)
+подсчитываются по кодам, а не прерывают проверку.
+
+    python -m scripts.stress_intake --threads 32 --contacts 2000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--contacts', type=int, default=2000)
+    parser.add_argument('--operators', type=int, default=20)
+    parser.add_argument('--max-load', type=int, default=25)
+    parser.add_argument(
+        '--database-url',
+        help='БД для проверки (по умолчанию временная SQLite)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        db_path = os.path.join(tempfile.mkdtemp(), 'stress.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ.setdefault('LOAD_RECONCILE_INTERVAL', '0')
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy import func
+
+    from app.core.config import settings
+    from app.database.session import SessionLocal
+    from app.main import app
+    from app.models import Contact, Operator
+
+    api = settings.API_V1_STR
+
+    with TestClient(app, raise_server_exceptions=False) as client:
+        operator_ids = [
+            client.post(f'{api}/operators/', json={
+                'name': f'stress-{i}', 'max_load': args.max_load
+            }).json()['id']
+            for i in range(args.operators)
+        ]
+        source_id = client.post(
+            f'{api}/sources/', json={'name': f'stress-{time.time()}'}
+        ).json()['id']
+        client.post(f'{api}/sources/{source_id}/weights/', json=[
+            {'operator_id': operator_id, 'weight': i % 10 + 1}
+            for i, operator_id in enumerate(operator_ids)
+        ])
+
+        def create(i):
+            response = client.post(f'{api}/contacts/', json={
+                'lead_external_id': f'stress-lead-{i}',
+                'source_id': source_id
+            })
+            return response.status_code
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            statuses = list(executor.map(create, range(args.contacts)))
+        elapsed = time.perf_counter() - started
+
+    db = SessionLocal()
+    try:
+        loads = dict(
+            db.query(Contact.operator_id, func.count(Contact.id))
+            .filter(Contact.operator_id.in_(operator_ids), Contact.is_open)
+            .group_by(Contact.operator_id)
+        )
+        operators = db.query(Operator).filter(
+            Operator.id.in_(operator_ids)).all()
+    finally:
+        db.close()
+
+    overbooked = {
+        operator.id: loads.get(operator.id, 0)
+        for operator in operators
+        if loads.get(operator.id, 0) > operator.max_load
+    }
+    counter_drift = {
+        operator.id: (operator.cached_load, loads.get(operator.id, 0))
+        for operator in operators
+        if operator.cached_load != loads.get(operator.id, 0)
+    }
+    errors = Counter(status for status in statuses if status != 201)
+
+    print(f'requests:      {len(statuses)} in {elapsed:.2f}s '
+          f'({len(statuses) / elapsed:.0f} req/s), '
+          f'errors: {sum(errors.values())}')
+    if errors:
+        print(f'error codes:   {dict(errors)}')
+    print(f'assigned:      {sum(loads.values())} '
+          f'of capacity {args.operators * args.max_load}')
+    print(f'overbooked:    {overbooked or 0}')
+    print(f'counter drift: {counter_drift or 0}')
+    return 1 if overbooked or counter_drift or errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())